@@ -0,0 +1,77 @@
+"""
+Reports recall@k and query latency of the HNSW backend of MmapVectorStore against exact search.
+
+    python -m benchmarks.bench_ann_recall --rows 200000 --dim 768 --ef 16,64,256
+"""
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+from utils.vector_store_utils import MmapVectorStore
+
+
+def make_vectors(rows, dim, clusters, rng):
+    """Clustered data: uniform random vectors are unrealistically hard for graph indexes."""
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    assignment = rng.integers(0, clusters, size=rows)
+    return centers[assignment] + 0.5 * rng.normal(size=(rows, dim)).astype(np.float32)
+
+
+def run_queries(store, queries, k):
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append(store.query(VectorStoreQuery(query_embedding=query.tolist(), similarity_top_k=k)).ids)
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef", default="16,32,64,128,256")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(args.rows, args.dim, max(args.rows // 500, 1), rng)
+    queries = make_vectors(args.queries, args.dim, max(args.rows // 500, 1), rng)
+    persist_path = os.path.join(tempfile.mkdtemp(), "default__vector_store.json")
+
+    store = MmapVectorStore()
+    batch = 10000
+    for start in range(0, args.rows, batch):
+        store.add([
+            TextNode(id_=str(row), text="", embedding=vectors[row].tolist())
+            for row in range(start, min(start + batch, args.rows))
+        ])
+    store.persist(persist_path)
+
+    exact = MmapVectorStore.from_persist_path(persist_path)
+    truth, exact_ms = run_queries(exact, queries, args.k)
+    print(f"{args.rows} rows x {args.dim} dims, k={args.k}")
+    print(f"exact        {exact_ms:8.3f} ms/query  recall@{args.k} 1.0000")
+
+    start = time.perf_counter()
+    MmapVectorStore(
+        ann_backend="hnsw", ann_m=args.m, ann_ef_construction=args.ef_construction
+    )._build_ann(exact._base).save(persist_path[:-len(".json")] + ".hnsw")
+    print(f"hnsw build   {time.perf_counter() - start:8.1f} s (M={args.m}, ef_construction={args.ef_construction})")
+
+    for ef in [int(value) for value in args.ef.split(",")]:
+        ann = MmapVectorStore.from_persist_path(
+            persist_path, ann_backend="hnsw", ann_m=args.m, ann_ef_construction=args.ef_construction, ann_ef_search=ef
+        )
+        found, ann_ms = run_queries(ann, queries, args.k)
+        recall = np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(found, truth)])
+        print(f"hnsw ef={ef:<4} {ann_ms:8.3f} ms/query  recall@{args.k} {recall:.4f}")
+
+
+if __name__ == "__main__":
+    main()
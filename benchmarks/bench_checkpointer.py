@@ -0,0 +1,65 @@
+"""
+Compares checkpoint write and read throughput of concurrent conversations: the single shared sqlite3
+connection graph.py used before, PooledSqliteSaver and the in-process InMemorySaver stand-in.
+
+    python -m benchmarks.bench_checkpointer --threads 16 --checkpoints 50
+"""
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.sqlite import SqliteSaver
+from utils.checkpoint_utils import PooledSqliteSaver
+
+
+def make_checkpoint(step, payload):
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"messages": payload, "step": step}
+    checkpoint["channel_versions"] = {"messages": step, "step": step}
+    return checkpoint
+
+
+def run_conversation(saver, thread_id, checkpoints, payload):
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    for step in range(1, checkpoints + 1):
+        config = saver.put(config, make_checkpoint(step, payload), {"step": step}, {"messages": step, "step": step})
+        saver.get_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}})
+
+
+def bench(label, saver, threads, checkpoints, payload):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(
+            lambda i: run_conversation(saver, f"{label}-{i}", checkpoints, payload), range(threads)
+        ))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {elapsed:7.2f}s  {threads * checkpoints / elapsed:8.0f} checkpoints/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--checkpoints", type=int, default=50)
+    parser.add_argument("--payload-kb", type=int, default=20)
+    args = parser.parse_args()
+
+    payload = "x" * (args.payload_kb * 1024)
+    tmp_dir = tempfile.mkdtemp(prefix="checkpointer_bench_")
+
+    single = SqliteSaver(sqlite3.connect(os.path.join(tmp_dir, "single.db"), check_same_thread=False))
+    single.setup()
+    bench("single", single, args.threads, args.checkpoints, payload)
+
+    pooled = PooledSqliteSaver(os.path.join(tmp_dir, "pooled.db"))
+    pooled.setup()
+    bench("pooled", pooled, args.threads, args.checkpoints, payload)
+
+    bench("memory", InMemorySaver(), args.threads, args.checkpoints, payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Compares the columnar, chunked CSV -> Document conversion of the issue index against the former
+df.iterrows() loop. The chunked path is consumed the way build_index does, one chunk at a time.
+
+    python -m benchmarks.bench_csv_ingestion --rows 100000
+"""
+import io
+import time
+import argparse
+import tracemalloc
+import pandas as pd
+from llama_index.core.schema import Document
+from tools.issue_resolution_matching_tool.issue_document_loader import (
+    compute_row_hash, make_issue_doc_id, iter_issue_document_chunks
+)
+
+
+def parse_issue_csv_iterrows(csv_content, blob_name):
+    """The per-row loop the issue index used before the columnar path."""
+    df = pd.read_csv(io.StringIO(csv_content))
+    documents = []
+    for index, row in df.iterrows():
+        issue_text = row['issue']
+        resolution_text = row['resolution']
+        category_text = row['category'] if 'category' in df.columns else None
+        row_hash = compute_row_hash(issue_text, resolution_text, category_text)
+        doc = Document(
+            id_=make_issue_doc_id(blob_name, row_hash),
+            text=resolution_text,
+            metadata={
+                "issue": issue_text,
+                "category": category_text,
+                "source_file": blob_name,
+                "row_number": index,
+                "row_hash": row_hash
+            },
+            excluded_embed_metadata_keys=["row_hash"],
+            excluded_llm_metadata_keys=["row_hash"]
+        )
+        # The old loop also stringified any metadata value that was not JSON-like
+        doc.metadata = {
+            key: value if isinstance(value, (str, int, float, bool, list, dict, type(None))) else str(value)
+            for key, value in doc.metadata.items()
+        }
+        documents.append(doc)
+    return [doc.id_ for doc in documents]
+
+
+def chunked_document_ids(csv_content, blob_name, chunk_rows):
+    """Document IDs from the chunked path; each chunk's documents are dropped before the next is read."""
+    ids = []
+    for documents in iter_issue_document_chunks(io.BytesIO(csv_content.encode("utf-8")), blob_name, chunk_rows):
+        ids.extend(doc.id_ for doc in documents)
+    return ids
+
+
+def make_csv(rows):
+    df = pd.DataFrame({
+        "issue": [f"Error E{i % 977} on screen {i % 53} when saving ticket {i}" for i in range(rows)],
+        "category": [f"category {i % 11}" for i in range(rows)],
+        "resolution": [f"Clear the cache, restart the app and retry step {i % 7}." for i in range(rows)],
+    })
+    return df.to_csv(index=False)
+
+
+def measure(name, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    document_ids = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<12} {elapsed:8.2f}s  peak {peak / 1024 / 1024:8.1f} MiB  {len(document_ids)} documents")
+    return document_ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--chunk-rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    csv_content = make_csv(args.rows)
+    blob_name = "issue_resolution_data_uploads/bench.csv"
+    print(f"{args.rows} rows, {len(csv_content) / 1024 / 1024:.1f} MiB of CSV")
+
+    old = measure("iterrows", lambda: parse_issue_csv_iterrows(csv_content, blob_name))
+    new = measure("chunked", lambda: chunked_document_ids(csv_content, blob_name, args.chunk_rows))
+    assert old == new, "both paths must produce the same document IDs"
+
+
+if __name__ == "__main__":
+    main()
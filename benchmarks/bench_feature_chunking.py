@@ -0,0 +1,75 @@
+"""
+Compares the old flat DOCX ingestion of the feature tool (paragraph text only, default splitter) with the
+heading-aware parser: nodes produced, tokens per node, table text kept and the context tokens the top-k
+retrieved nodes put into every prompt.
+
+    python -m benchmarks.bench_feature_chunking --sections 200 --top-k 2
+"""
+import io
+import argparse
+import numpy as np
+from docx import Document as DocxDocument
+from llama_index.core.schema import Document
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.utils import get_tokenizer
+from tools.feature_query_tool.feature_document_loader import (
+    FEATURE_CHUNK_SIZE, FEATURE_CHUNK_OVERLAP, parse_docx_sections, documents_to_nodes_fq
+)
+
+WORDS = (
+    "configure account billing invoice export report dashboard user role permission sync schedule "
+    "template workflow approval notification email webhook integration token limit backup restore"
+).split()
+
+
+def make_docx(sections, rng):
+    docx = DocxDocument()
+    for section in range(sections):
+        docx.add_heading(f"Feature {section}", level=1)
+        for sub in range(2):
+            docx.add_heading(f"Feature {section} option {sub}", level=2)
+            for _ in range(int(rng.integers(2, 5))):
+                docx.add_paragraph(" ".join(rng.choice(WORDS, size=int(rng.integers(30, 90)))) + ".")
+        table = docx.add_table(rows=4, cols=3)
+        for row in table.rows:
+            for cell in row.cells:
+                cell.text = f"limit{section}_" + "_".join(rng.choice(WORDS, size=2))
+    buffer = io.BytesIO()
+    docx.save(buffer)
+    buffer.seek(0)
+    return DocxDocument(buffer)
+
+
+def report(name, nodes, table_values, top_k, tokenizer):
+    tokens = np.array([len(tokenizer(node.get_content())) for node in nodes])
+    text = "\n".join(node.get_content() for node in nodes)
+    kept = sum(value in text for value in table_values) / len(table_values)
+    print(
+        f"{name:<14} nodes {len(nodes):5d}  tokens/node mean {tokens.mean():6.0f} max {tokens.max():5d}  "
+        f"table cells kept {kept:6.1%}  context tokens at top-{top_k} ~{tokens.mean() * top_k:6.0f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sections", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=2)
+    args = parser.parse_args()
+
+    docx = make_docx(args.sections, np.random.default_rng(0))
+    tokenizer = get_tokenizer()
+    table_values = [cell.text for table in docx.tables for row in table.rows for cell in row.cells]
+
+    # Before: paragraph text only, one document per file, LlamaIndex's default splitter (1024 / 200)
+    flat = Document(text="\n".join(para.text for para in docx.paragraphs), metadata={"filename": "bench.docx"})
+    report("flat", SentenceSplitter().get_nodes_from_documents([flat]), table_values, args.top_k, tokenizer)
+
+    sections = parse_docx_sections(docx, "bench.docx")
+    report(
+        f"sections {FEATURE_CHUNK_SIZE}/{FEATURE_CHUNK_OVERLAP}", documents_to_nodes_fq(sections),
+        table_values, args.top_k, tokenizer
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Checks the index coordination of utils/index_sync_utils.py with the local backend, the stand-in for
+the blob backend: two worker processes share one INDEX_SYNC_LOCAL_DIR and keep their own index roots.
+
+    python -m benchmarks.check_index_sync
+
+It checks that a version built by one worker is hot-reloaded by the other, and that two builds started
+at the same time run one after the other. Exits with status 1 if a check fails.
+"""
+import os
+import sys
+import time
+import queue
+import argparse
+import tempfile
+import multiprocessing
+
+KIND = "issue"
+DATA_FILENAME = "data.txt"
+
+
+def worker(name, local_root, commands, events):
+    # Imported here: the module reads INDEX_SYNC_* when it is imported, after main() has set them
+    from utils.index_sync_utils import register_synced_index, start_index_sync, load_synced_index, synced_build
+    from utils.index_version_utils import create_version_dir, publish_version, get_current_version_dir
+
+    def reload():
+        version_dir = get_current_version_dir(local_root)
+        data = None
+        if version_dir:
+            with open(os.path.join(version_dir, DATA_FILENAME), "r", encoding="utf-8") as f:
+                data = f.read()
+        events.put((name, "serving", data))
+
+    def build(hold_seconds):
+        # Stands in for a real build: extends the version it starts from by one line
+        previous_dir = get_current_version_dir(local_root)
+        previous = ""
+        if previous_dir:
+            with open(os.path.join(previous_dir, DATA_FILENAME), "r", encoding="utf-8") as f:
+                previous = f.read()
+        events.put((name, "build_started", time.time()))
+        time.sleep(hold_seconds)
+        version_id, version_dir = create_version_dir(local_root)
+        data = previous + f"{name}\n"
+        with open(os.path.join(version_dir, DATA_FILENAME), "w", encoding="utf-8") as f:
+            f.write(data)
+        publish_version(local_root, version_id)
+        events.put((name, "build_finished", (time.time(), data)))
+        return True
+
+    register_synced_index(KIND, local_root, reload)
+    start_index_sync()
+    load_synced_index(KIND)
+    while True:
+        command, arg = commands.get()
+        if command == "stop":
+            return
+        synced_build(KIND, lambda: build(arg))
+
+
+def wait_for(events, predicate, timeout, seen):
+    """Collects events into seen until predicate(event) holds for one of them; returns it or None."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            event = events.get(timeout=max(0.0, deadline - time.time()))
+        except queue.Empty:
+            break
+        seen.append(event)
+        if predicate(event):
+            return event
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--poll-seconds", type=float, default=0.5)
+    parser.add_argument("--build-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="index_sync_check_")
+    os.environ["INDEX_SYNC_BACKEND"] = "local"
+    os.environ["INDEX_SYNC_LOCAL_DIR"] = os.path.join(tmp_dir, "shared")
+    os.environ["INDEX_SYNC_POLL_SECONDS"] = str(args.poll_seconds)
+
+    context = multiprocessing.get_context("spawn")
+    events = context.Queue()
+    workers = {}
+    for name in ("a", "b"):
+        commands = context.Queue()
+        process = context.Process(
+            target=worker, args=(name, os.path.join(tmp_dir, name), commands, events), daemon=True
+        )
+        process.start()
+        workers[name] = commands
+
+    seen = []
+    failures = 0
+
+    def check(label, ok):
+        nonlocal failures
+        print(f"{'PASS' if ok else 'FAIL'}  {label}")
+        failures += not ok
+
+    for _ in workers:
+        wait_for(events, lambda e: e[1] == "serving", 30, seen)
+
+    # 1. a publishes its build to the shared store; b reloads it on its next poll
+    workers["a"].put(("build", 0))
+    reloaded = wait_for(events, lambda e: e[:2] == ("b", "serving") and e[2] == "a\n", 10 * args.poll_seconds + 5, seen)
+    check("b hot-reloads the version built by a", reloaded is not None)
+
+    # 2. Builds started at the same time take turns on the builder lock, and the second builds on the first
+    seen.clear()
+    workers["a"].put(("build", args.build_seconds))
+    workers["b"].put(("build", args.build_seconds))
+    deadline = time.time() + 4 * args.build_seconds + 10
+    while sum(e[1] == "build_finished" for e in seen) < 2 and time.time() < deadline:
+        wait_for(events, lambda e: e[1] == "build_finished", deadline - time.time(), seen)
+    started = {name: value for name, kind, value in seen if kind == "build_started"}
+    finished = {name: value for name, kind, value in seen if kind == "build_finished"}
+    check("both concurrent builds finish", len(finished) == 2)
+    if len(finished) == 2:
+        first, second = sorted(started, key=started.get)
+        check("the second build waits for the first one", started[second] >= finished[first][0])
+        check("the second build starts from the first one's version", finished[second][1] == f"a\n{first}\n{second}\n")
+
+        # 3. The first builder then reloads the second one's version
+        reloaded = wait_for(
+            events, lambda e: e[:2] == (first, "serving") and e[2] == finished[second][1],
+            10 * args.poll_seconds + 5, seen
+        )
+        check(f"{first} hot-reloads the version built by {second}", reloaded is not None)
+
+    for commands in workers.values():
+        commands.put(("stop", None))
+    print(f"Shared store: {os.environ['INDEX_SYNC_LOCAL_DIR']}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
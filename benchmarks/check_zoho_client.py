@@ -0,0 +1,92 @@
+"""
+Checks the pooled Zoho client of utils/zoho_utils.py against utils/zoho_mock_server.py, through the ticket tools.
+
+    python -m benchmarks.check_zoho_client --calls 20 --concurrency 8
+
+It checks that sequential calls (sync and async) each reuse one keep-alive connection, and that concurrent
+calls after every token was revoked cause a single token request. Exits with status 1 if a check fails.
+"""
+import os
+import sys
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from utils.zoho_mock_server import start_zoho_mock_server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    server, base_url = start_zoho_mock_server()
+    state = server.state
+    # The client reads its configuration on first use, so this points it at the mock server
+    os.environ.update({
+        "ZOHO_DESK_BASE_URL": base_url,
+        "ZOHO_ACCOUNTS_BASE_URL": base_url,
+        "ZOHO_REFRESH_TOKEN": "mock",
+        "ZOHO_CLIENT_ID": "mock",
+        "ZOHO_CLIENT_SECRET": "mock",
+        "ZOHO_ORG_ID": "1",
+        "ZOHO_DEPARTMENT_ID": "1",
+        "ZOHO_CONTACT_ID": "1"
+    })
+    from tools.issue_ticket_creation_tool import create_zoho_ticket, acreate_zoho_ticket
+    from tools.issue_ticket_status_tool import get_ticket_status, aget_ticket_status
+    from utils.zoho_utils import get_zoho_token_stats
+
+    email = "user@example.com"
+    failures = 0
+
+    def check(label, ok, detail):
+        nonlocal failures
+        print(f"{'PASS' if ok else 'FAIL'}  {label} ({detail})")
+        failures += not ok
+
+    # 1. Sequential sync calls, token request included, share one connection
+    for i in range(args.calls):
+        ticket_id = create_zoho_ticket(f"Sync ticket {i}", email)["message"].rsplit(" ", 1)[-1].rstrip(".")
+        get_ticket_status(ticket_id, email)
+    check(
+        f"{2 * args.calls} sequential sync calls use one connection", state.connections == 1,
+        f"connections={state.connections}, requests={state.requests}, token_requests={state.token_requests}"
+    )
+
+    # 2. Concurrent calls that all find their token rejected refresh it once
+    state.expire_tokens()
+    token_requests = state.token_requests
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(lambda i: create_zoho_ticket(f"Concurrent ticket {i}", email), range(args.concurrency)))
+    check(
+        f"{args.concurrency} concurrent sync calls after the tokens were revoked refresh once",
+        state.token_requests - token_requests == 1, f"token_requests={state.token_requests - token_requests}"
+    )
+
+    # 3. The same for the async client, which keeps its own connection pool
+    async def run_async():
+        connections = state.connections
+        for i in range(args.calls):
+            await aget_ticket_status("1", email)
+        check(
+            f"{args.calls} sequential async calls use one connection", state.connections - connections == 1,
+            f"connections={state.connections - connections}"
+        )
+
+        state.expire_tokens()
+        token_requests = state.token_requests
+        await asyncio.gather(*(acreate_zoho_ticket(f"Async ticket {i}", email) for i in range(args.concurrency)))
+        check(
+            f"{args.concurrency} concurrent async calls after the tokens were revoked refresh once",
+            state.token_requests - token_requests == 1, f"token_requests={state.token_requests - token_requests}"
+        )
+
+    asyncio.run(run_async())
+    print(f"Token stats: {get_zoho_token_stats()}")
+    server.shutdown()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
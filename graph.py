@@ -1,33 +1,48 @@
 import os
-import sqlite3
-from langchain_google_genai import ChatGoogleGenerativeAI
+import threading
 from langgraph.graph import MessagesState
-from langchain_core.messages import SystemMessage
-from langgraph.checkpoint.sqlite import SqliteSaver
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage, RemoveMessage
+from langchain_core.messages.utils import count_tokens_approximately, trim_messages
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import START, END, StateGraph
 from langgraph.prebuilt import tools_condition
 from langgraph.prebuilt import ToolNode
-from tools.feature_query_tool.feature_query_tool import get_feature_chat_engine
-from tools.issue_resolution_matching_tool.issue_resolution_matching_tool import get_issue_chat_engine
-from tools.issue_ticket_creation_tool import create_zoho_ticket
-from tools.issue_ticket_status_tool  import get_ticket_status
-from prompts import AGENT_PROMPT
-
-llm = ChatGoogleGenerativeAI(model=os.getenv("AGENT_LLM"))
-
-# Define path depending on environment
-if os.getenv("WEBSITE_SITE_NAME"):
-    # Running on Azure Web App
-    db_path = "/home/chat_memory.db"
-else:
-    # Running locally
-    db_path = "chat_memory.db"
-    
-print(f"DB Path = {db_path}")
-conn = sqlite3.connect(db_path, check_same_thread=False)
-
-conv_len = 4
-actual_conv_len = conv_len * 4
+from langgraph.config import get_config
+from langchain_core.tools import StructuredTool
+from llama_index.core import Settings
+from tools.feature_query_tool.feature_query_tool import get_feature_chat_engine, get_feature_index_version
+from tools.issue_resolution_matching_tool.issue_resolution_matching_tool import (
+    match_issue_resolution, record_cached_issue_answer, get_issue_index_version, is_issue_index_loaded
+)
+from tools.issue_ticket_creation_tool import create_zoho_ticket, acreate_zoho_ticket
+from tools.issue_ticket_status_tool  import get_ticket_status, aget_ticket_status
+from prompts import AGENT_PROMPT, SUMMARY_PROMPT
+from utils.checkpoint_utils import create_checkpointer
+from utils.answer_cache_utils import SemanticAnswerCache
+from utils.rag_settings_utils import init_rag_settings
+
+# Number of most recent exchanges (a user message and everything answering it) kept verbatim
+conv_len = int(os.getenv("CONV_KEEP_EXCHANGES", "4"))
+# Older exchanges are also folded into the summary once the verbatim part exceeds this many tokens
+summary_trigger_tokens = int(os.getenv("CONV_SUMMARY_TRIGGER_TOKENS", "4000"))
+# Hard cap on the history sent to the agent LLM on every turn
+max_history_tokens = int(os.getenv("CONV_MAX_HISTORY_TOKENS", "6000"))
+# Summarization waits until this many exchanges beyond conv_len have piled up (or the history exceeds
+# max_history_tokens) and then folds them in one call, instead of costing an LLM call on every turn
+summary_batch = int(os.getenv("CONV_SUMMARY_BATCH", "4"))
+summary_max_words = int(os.getenv("CONV_SUMMARY_MAX_WORDS", "200"))
+# Tool outputs are cut to this many characters in the text handed to the summarizer
+summary_tool_output_chars = int(os.getenv("CONV_SUMMARY_TOOL_OUTPUT_CHARS", "500"))
+
+def embed_query(query: str):
+    init_rag_settings()
+    return Settings.embed_model.get_query_embedding(query)
+
+
+# One answer cache per index; each is emptied when its index publishes a new version
+feature_answer_cache = SemanticAnswerCache("feature", embed_query)
+issue_answer_cache = SemanticAnswerCache("issue", embed_query)
+
 
 def feature_query_tool(query: str) -> str:
     """Answer for knowledge-based questions."""
@@ -35,8 +50,14 @@ def feature_query_tool(query: str) -> str:
         query_engine = get_feature_chat_engine()
         if query_engine is None:
             return "Feature query engine is not available. Please upload some documents first."
-        
+
+        version = get_feature_index_version()
+        cached, embedding = feature_answer_cache.lookup(query, version)
+        if cached is not None:
+            return cached
+
         result = query_engine.query(query).response
+        feature_answer_cache.store(query, embedding, result, version)
         return result
     except Exception as e:
         return f"Error processing feature query: {str(e)}"
@@ -59,10 +80,32 @@ def feature_query_tool(query: str) -> str:
 
 def issue_resolution_matching_tool(query: str) -> str:
     """answers resolutions from previously created similar ticket."""
-    engine = get_issue_chat_engine()
-    if engine is None:
+    thread_id = get_config().get("configurable", {}).get("thread_id")
+    if not is_issue_index_loaded():
+        return "No resolution found"
+
+    version = get_issue_index_version()
+    cached, embedding = issue_answer_cache.lookup(query, version)
+    if cached is not None:
+        record_cached_issue_answer(query, cached, thread_id)
+        return cached
+
+    # Confident matches and clear misses are answered without the LLM
+    result = match_issue_resolution(query, thread_id)
+    if result is None:
         return "No resolution found"
-    return engine.chat(query).response
+    answer, path = result
+    # LLM answers are shaped by this thread's memory, so only thread-independent answers are shared
+    if path != "llm":
+        issue_answer_cache.store(query, embedding, answer, version)
+    return answer
+
+
+def get_answer_cache_stats():
+    return {
+        "feature": feature_answer_cache.get_stats(),
+        "issue": issue_answer_cache.get_stats()
+    }
 
 def issue_ticket_creation_tool(query: str, email: str) -> str:
     """For creating a new Zoho Desk ticket"""
@@ -82,42 +125,206 @@ def issue_ticket_status_tool(query: str, email: str) -> str:
     #     "content": result
     # }
 
-tools = [feature_query_tool, issue_resolution_matching_tool, issue_ticket_creation_tool, issue_ticket_status_tool]
-llm_with_tools = llm.bind_tools(tools)
+async def aissue_ticket_creation_tool(query: str, email: str) -> str:
+    return await acreate_zoho_ticket(query, email)
+
+async def aissue_ticket_status_tool(query: str, email: str) -> str:
+    return await aget_ticket_status(query, email)
+
+# The Zoho tools also get a coroutine, so streamed (async) runs call Zoho on the shared httpx client
+# instead of blocking an executor thread
+tools = [
+    feature_query_tool,
+    issue_resolution_matching_tool,
+    StructuredTool.from_function(func=issue_ticket_creation_tool, coroutine=aissue_ticket_creation_tool),
+    StructuredTool.from_function(func=issue_ticket_status_tool, coroutine=aissue_ticket_status_tool)
+]
+
+# Created on first use, so importing this module does not build the Gemini client
+llm = None
+llm_with_tools = None
+_llm_lock = threading.Lock()
+
+
+def get_llm():
+    """Returns (agent LLM, agent LLM with the tools bound)."""
+    global llm, llm_with_tools
+    with _llm_lock:
+        if llm is None:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+
+            llm = ChatGoogleGenerativeAI(model=os.getenv("AGENT_LLM"))
+            llm_with_tools = llm.bind_tools(tools)
+        return llm, llm_with_tools
+
+class State(MessagesState):
+    summary: str
+
+
+def split_history(messages):
+    """
+    Splits the message history into (older, recent) at an exchange boundary.
+    recent holds at most conv_len exchanges and, beyond the last one, stays within summary_trigger_tokens.
+    """
+    human_indexes = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+    if len(human_indexes) <= 1:
+        return [], messages
+
+    kept = min(conv_len, len(human_indexes))
+    while kept > 1 and count_tokens_approximately(messages[human_indexes[-kept]:]) > summary_trigger_tokens:
+        kept -= 1
+
+    cut = human_indexes[-kept]
+    return messages[:cut], messages[cut:]
+
+
+def needs_summary(messages):
+    exchanges = sum(isinstance(m, HumanMessage) for m in messages)
+    if exchanges <= 1:
+        return False
+    return exchanges > conv_len + summary_batch or count_tokens_approximately(messages) > max_history_tokens
+
+
+def message_text(content):
+    """Plain text of a message or chunk content, which Gemini may return as a list of parts."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            part if isinstance(part, str) else part.get("text", "")
+            for part in content
+            if isinstance(part, (str, dict))
+        )
+    return ""
+
+
+def format_transcript(messages):
+    lines = []
+    for m in messages:
+        text = message_text(m.content)
+        if isinstance(m, HumanMessage):
+            lines.append(f"User: {text}")
+        elif isinstance(m, ToolMessage):
+            lines.append(f"Tool result ({m.name}): {text[:summary_tool_output_chars]}")
+        elif isinstance(m, AIMessage) and text:
+            lines.append(f"Assistant: {text}")
+    return "\n".join(lines)
 
-State = MessagesState
 
 # System message
 sys_msg = SystemMessage(
     content= AGENT_PROMPT
 )
+def build_agent_messages(state: State):
+    system_message = sys_msg
+    if state.get("summary"):
+        system_message = SystemMessage(
+            content=f"{AGENT_PROMPT}\n\nSummary of the earlier conversation:\n{state['summary']}"
+        )
+
+    history = trim_messages(
+        state["messages"],
+        max_tokens=max_history_tokens,
+        token_counter=count_tokens_approximately,
+        strategy="last",
+        start_on="human",
+        include_system=False,
+    )
+    if not history:
+        # The latest exchange alone is over budget; still send it whole
+        human_indexes = [i for i, m in enumerate(state["messages"]) if isinstance(m, HumanMessage)]
+        history = state["messages"][human_indexes[-1]:] if human_indexes else state["messages"]
+
+    return [system_message] + history
+
+
+def build_summary_prompt(state: State, older):
+    return SUMMARY_PROMPT.format(
+        summary=state.get("summary", ""),
+        transcript=format_transcript(older),
+        max_words=summary_max_words,
+    )
+
+
 # Node
 def assistant(state: State):
-    # print("Assistant node started!!")
-    messages = [sys_msg] + state["messages"]
-    # print(state["messages"])
-    # for m in messages:
-    #     m.pretty_print()
-    return {"messages": state["messages"] + [llm_with_tools.invoke(messages)]}
+    _, agent_llm = get_llm()
+    return {"messages": [agent_llm.invoke(build_agent_messages(state))]}
+
+
+async def aassistant(state: State):
+    _, agent_llm = get_llm()
+    return {"messages": [await agent_llm.ainvoke(build_agent_messages(state))]}
+
+
+def summarize_conversation(state: State):
+    """Folds the exchanges outside the verbatim window into the running summary and drops them."""
+    older, _ = split_history(state["messages"])
+    summary_llm, _ = get_llm()
+    response = summary_llm.invoke([HumanMessage(content=build_summary_prompt(state, older))])
+    return {
+        "summary": message_text(response.content),
+        "messages": [RemoveMessage(id=m.id) for m in older],
+    }
+
+
+async def asummarize_conversation(state: State):
+    older, _ = split_history(state["messages"])
+    summary_llm, _ = get_llm()
+    response = await summary_llm.ainvoke([HumanMessage(content=build_summary_prompt(state, older))])
+    return {
+        "summary": message_text(response.content),
+        "messages": [RemoveMessage(id=m.id) for m in older],
+    }
+
+
+def route_after_assistant(state: State):
+    if tools_condition(state) == "tools":
+        return "tools"
+    if needs_summary(state["messages"]) and split_history(state["messages"])[0]:
+        return "summarize_conversation"
+    return END
 
 # Graph
 builder = StateGraph(State)
 
 # Define nodes: these do the work
-builder.add_node("assistant", assistant)
+# Async variants let streaming runs await the LLM instead of holding a threadpool worker
+builder.add_node("assistant", RunnableLambda(assistant, afunc=aassistant, name="assistant"))
 builder.add_node("tools", ToolNode(tools))
-# builder.add_node(summarize_conversation)
+builder.add_node(
+    "summarize_conversation",
+    RunnableLambda(summarize_conversation, afunc=asummarize_conversation, name="summarize_conversation"),
+)
 
 # Define edges: these determine how the control flow moves
 builder.add_edge(START, "assistant")
 builder.add_conditional_edges(
     "assistant",
-    # If the latest message (result) from assistant is a tool call -> tools_condition routes to tools
-    # If the latest message (result) from assistant is a not a tool call -> tools_condition routes to END
-    tools_condition,
+    # If the latest message (result) from assistant is a tool call -> route to tools
+    # Otherwise summarize exchanges that fell out of the verbatim window, or finish
+    route_after_assistant,
+    ["tools", "summarize_conversation", END],
 )
 # builder.add_edge("tools", "assistant")
 builder.add_edge("tools", "assistant")
-builder.add_edge("assistant", END)
-memory = SqliteSaver(conn)
-react_graph = builder.compile(checkpointer=memory)
\ No newline at end of file
+builder.add_edge("summarize_conversation", END)
+# Compiled on first use (or during app startup) together with the checkpointer, whose backend is
+# chosen by CHECKPOINTER_BACKEND; all of them serve both invoke() and astream_events()
+memory = None
+react_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_react_graph():
+    global memory, react_graph
+    with _graph_lock:
+        if react_graph is None:
+            memory = create_checkpointer()
+            react_graph = builder.compile(checkpointer=memory)
+        return react_graph
+
+
+def get_checkpointer():
+    get_react_graph()
+    return memory
\ No newline at end of file
@@ -1,20 +1,37 @@
 import os
 import json
-import pprint
 import re
+import threading
 from typing import List
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, File, HTTPException, Query, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from langchain_core.messages import HumanMessage, BaseMessage, ToolMessage
+from langchain_core.messages import HumanMessage
 from openai import BaseModel
 import requests
 from azure.storage.blob import ContainerClient
-from graph import react_graph
+from graph import get_react_graph, get_checkpointer, get_answer_cache_stats, message_text
 from uuid import uuid4
 from dotenv import load_dotenv
-from tools.feature_query_tool.feature_query_tool import build_index_fq
-from tools.issue_resolution_matching_tool.issue_resolution_matching_tool import build_index
+from tools.feature_query_tool.feature_query_tool import (
+    build_index_fq, load_existing_index_fq, get_index_versions_fq, rollback_index_fq, get_feature_query_stats,
+    index_storage_dir as feature_index_storage_dir
+)
+from tools.issue_resolution_matching_tool.issue_resolution_matching_tool import (
+    build_index, load_existing_index, get_issue_match_stats, get_index_versions, rollback_index,
+    index_storage_dir as issue_index_storage_dir
+)
+from utils.job_utils import register_index_builder, enqueue_index_job, get_job
+from utils.rag_settings_utils import get_embedding_stats
+from utils.zoho_utils import start_zoho_token_refresher, get_zoho_token_stats
+from utils.index_sync_utils import (
+    register_synced_index, synced_build, synced_rollback, load_synced_index, start_index_sync,
+    get_index_sync_status
+)
+from utils.checkpoint_utils import start_checkpoint_retention, get_checkpoint_stats
 
 load_dotenv()
 def langsmith_config():
@@ -25,7 +42,49 @@ def langsmith_config():
 
 langsmith_config()
 
-app = FastAPI()
+# Startup state of each index: pending, loading, loaded or failed
+index_load_status = {"issue": "pending", "feature": "pending"}
+# Background jobs that failed to start, with their error; reported by /healthz/ready
+startup_errors = {}
+
+
+def load_index_on_startup(kind):
+    index_load_status[kind] = "loading"
+    try:
+        load_synced_index(kind)
+        index_load_status[kind] = "loaded"
+    except Exception as e:
+        print(f"Failed to load the {kind} index on startup: {e}")
+        index_load_status[kind] = "failed"
+
+
+def warm_up():
+    """Compiles the graph, starts the background jobs and loads both persisted indexes in parallel."""
+    # Index sync decides whether the shared or the local version is loaded, so it starts first
+    startup_jobs = [
+        ("checkpoint_retention", lambda: start_checkpoint_retention(get_checkpointer())),
+        ("index_sync", lambda: start_index_sync(get_container_client())),
+        ("zoho_token_refresh", start_zoho_token_refresher)
+    ]
+    for name, start in startup_jobs:
+        try:
+            start()
+        except Exception as e:
+            print(f"Failed to start {name}: {e}")
+            startup_errors[name] = str(e)
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="index-load") as executor:
+        list(executor.map(load_index_on_startup, ["issue", "feature"]))
+    print("Startup index loading finished.")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Requests are served while this runs; /healthz/ready reports when the indexes are loaded
+    threading.Thread(target=warm_up, name="startup-warm-up", daemon=True).start()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Add this section
 app.add_middleware(
@@ -53,15 +112,46 @@ ALLOWED_EXTENSIONS = {".csv", ".docx"}
 AZURE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
 CONTAINER_NAME = os.getenv("AZURE_CONTAINER_NAME")
 
-container_client = ContainerClient.from_connection_string(AZURE_CONNECTION_STRING, container_name=CONTAINER_NAME)
+container_client = None
+_container_client_lock = threading.Lock()
+
+
+def get_container_client():
+    """Created on first use, so importing main does not need the Azure connection string."""
+    global container_client
+    with _container_client_lock:
+        if container_client is None:
+            container_client = ContainerClient.from_connection_string(AZURE_CONNECTION_STRING, container_name=CONTAINER_NAME)
+        return container_client
+
+
+@app.get("/healthz/ready")
+def readiness():
+    """
+    200 once both indexes finished loading (even if one failed or is empty), 503 before that.
+    startup_errors lists the background jobs (checkpoint retention, index sync, Zoho token refresh) that failed to start.
+    """
+    ready = all(status in ("loaded", "failed") for status in index_load_status.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "indexes": dict(index_load_status), "startup_errors": dict(startup_errors)}
+    )
 
 @app.get("/api/query")
-def query(user_query: str = Query(...), thread_id: str | None = Query(None)):
+def query(
+    user_query: str = Query(...),
+    thread_id: str | None = Query(None),
+    response_mode: str = Query("minimal", pattern="^(minimal|full)$")
+):
+    """
+    response_mode=minimal returns only the messages of this turn; full also returns
+    the whole thread history in all_messages_in_message_state.
+    """
     try:
         current_thread_id = thread_id or str(uuid4())
-        human_message = HumanMessage(content=user_query)
+        human_message = HumanMessage(content=user_query, id=str(uuid4()))
         config = {"configurable": {"thread_id": current_thread_id}}
-        response = react_graph.invoke({"messages": [human_message]}, config)
+        response = get_react_graph().invoke({"messages": [human_message]}, config)
         number_of_messages = len(response['messages'])
         # Extract the content from the last message
         # for m in response['messages']:
@@ -71,13 +161,18 @@ def query(user_query: str = Query(...), thread_id: str | None = Query(None)):
             last_message = messages[-1]
             # logging.info(last_message)
             content = getattr(last_message, "content", "")
-            
+
+            # Messages from this turn's user message onwards
+            turn_start = next((i for i, m in enumerate(messages) if m.id == human_message.id), 0)
+
             response_data = {
                 "result": content,
                 "message_state_length": number_of_messages,
-                "all_messages_in_message_state": response["messages"],
+                "messages": messages[turn_start:],
                 "thread_id": current_thread_id
             }
+            if response_mode == "full":
+                response_data["all_messages_in_message_state"] = messages
 
         # Add the summary to the response if it exists and is not None
         if isinstance(response, dict) and response.get("summary") is not None:
@@ -89,6 +184,74 @@ def query(user_query: str = Query(...), thread_id: str | None = Query(None)):
     except Exception as e:
         return {"error": str(e)}
 
+@app.get("/api/threads/{thread_id}/messages")
+def get_thread_messages(
+    thread_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500)
+):
+    """Paginated message history of a thread, oldest first."""
+    config = {"configurable": {"thread_id": thread_id}}
+    state = get_react_graph().get_state(config)
+    messages = state.values.get("messages", []) if state else []
+    return {
+        "thread_id": thread_id,
+        "total": len(messages),
+        "offset": offset,
+        "limit": limit,
+        "messages": messages[offset:offset + limit],
+        "summary": state.values.get("summary") if state else None
+    }
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@app.get("/api/query/stream")
+async def query_stream(user_query: str = Query(...), thread_id: str | None = Query(None)):
+    """Same as /api/query, but pushes LLM tokens and tool start/end events as server-sent events."""
+    current_thread_id = thread_id or str(uuid4())
+    config = {"configurable": {"thread_id": current_thread_id}}
+    graph = get_react_graph()
+
+    async def event_stream():
+        yield sse_event("start", {"thread_id": current_thread_id})
+        try:
+            events = graph.astream_events(
+                {"messages": [HumanMessage(content=user_query)]}, config, version="v2"
+            )
+            async for event in events:
+                kind = event["event"]
+                node = event.get("metadata", {}).get("langgraph_node")
+
+                if kind == "on_chat_model_stream" and node == "assistant":
+                    text = message_text(event["data"]["chunk"].content)
+                    if text:
+                        yield sse_event("token", {"content": text})
+                elif kind == "on_tool_start":
+                    yield sse_event("tool_start", {"name": event["name"], "input": event["data"].get("input")})
+                elif kind == "on_tool_end":
+                    output = event["data"].get("output")
+                    yield sse_event("tool_end", {"name": event["name"], "output": getattr(output, "content", output)})
+
+            state = await graph.aget_state(config)
+            messages = state.values.get("messages", [])
+            response_data = {
+                "result": messages[-1].content if messages else "",
+                "thread_id": current_thread_id
+            }
+            if state.values.get("summary") is not None:
+                response_data["summary"] = state.values["summary"]
+            yield sse_event("end", response_data)
+        except Exception as e:
+            yield sse_event("error", {"error": str(e), "thread_id": current_thread_id})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 class ChatEntry(BaseModel):
     user: str
     assistant: str
@@ -170,7 +333,23 @@ def secure_filename(filename: str) -> str:
     return filename
 
 
-@app.post("/upload/issue")
+def build_issue_index(progress_callback=None):
+    return synced_build("issue", lambda: build_index(get_container_client(), progress_callback=progress_callback))
+
+
+def build_feature_index(progress_callback=None):
+    return synced_build("feature", lambda: build_index_fq(get_container_client(), progress_callback=progress_callback))
+
+
+register_index_builder("issue", build_issue_index)
+register_index_builder("feature", build_feature_index)
+
+# With INDEX_SYNC_BACKEND set, one worker builds and every worker hot-reloads the shared versions
+register_synced_index("issue", issue_index_storage_dir, lambda: load_existing_index(get_container_client()))
+register_synced_index("feature", feature_index_storage_dir, lambda: load_existing_index_fq(get_container_client()))
+
+
+@app.post("/upload/issue", status_code=202)
 async def upload_issue_file(file: UploadFile = File()):
     filename = secure_filename(file.filename)
     if not filename.endswith(".csv"):
@@ -183,19 +362,15 @@ async def upload_issue_file(file: UploadFile = File()):
     blob_path = ISSUE_UPLOADS_BLOB_PREFIX + filename
 
     try:
-        blob_client = container_client.get_blob_client(blob_path)
-        blob_client.upload_blob(contents, overwrite=True)
+        blob_client = get_container_client().get_blob_client(blob_path)
+        await run_in_threadpool(blob_client.upload_blob, contents, overwrite=True)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to upload file to Azure Blob Storage: {str(e)}")
 
-    try:
-        build_index(container_client)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to rebuild index after upload: {str(e)}")
-
-    return {"message": f"Uploaded '{filename}' for issue and reindexed successfully."}
+    job = enqueue_index_job("issue", f"upload:{filename}")
+    return {"message": f"Uploaded '{filename}' for issue. Reindex queued.", "job_id": job["job_id"]}
 
-@app.post("/upload/feature")
+@app.post("/upload/feature", status_code=202)
 async def upload_feature_file(file: UploadFile = File()):
     filename = secure_filename(file.filename)
     if not filename.endswith(".docx"):
@@ -208,19 +383,15 @@ async def upload_feature_file(file: UploadFile = File()):
     blob_path = FEATURE_UPLOADS_BLOB_PREFIX + filename
 
     try:
-        blob_client = container_client.get_blob_client(blob_path)
-        blob_client.upload_blob(contents, overwrite=True)
+        blob_client = get_container_client().get_blob_client(blob_path)
+        await run_in_threadpool(blob_client.upload_blob, contents, overwrite=True)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to upload file to Azure Blob Storage: {str(e)}")
 
-    try:
-        build_index_fq(container_client)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to rebuild index after upload: {str(e)}")
-
-    return {"message": f"Uploaded '{filename}' for feature and reindexed successfully."}
+    job = enqueue_index_job("feature", f"upload:{filename}")
+    return {"message": f"Uploaded '{filename}' for feature. Reindex queued.", "job_id": job["job_id"]}
 
-@app.delete("/delete/issue")
+@app.delete("/delete/issue", status_code=202)
 async def delete_issue_file(filename: str = Query()):
     filename = secure_filename(filename)
     if not filename.endswith(".csv"):
@@ -229,25 +400,16 @@ async def delete_issue_file(filename: str = Query()):
     full_blob_name = ISSUE_UPLOADS_BLOB_PREFIX + filename
 
     try:
-        blob_client = container_client.get_blob_client(full_blob_name)
-        blob_client.delete_blob()
+        blob_client = get_container_client().get_blob_client(full_blob_name)
+        await run_in_threadpool(blob_client.delete_blob)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete blob: {str(e)}")
 
-    try:
-        success = build_index(container_client)
-        if not success:
-            return {
-                "message": f"Deleted '{filename}' for issue. No remaining files to reindex.",
-                "index_status": "empty"
-            }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to rebuild index after deletion: {str(e)}")
+    job = enqueue_index_job("issue", f"delete:{filename}")
+    return {"message": f"Deleted '{filename}' for issue. Reindex queued.", "job_id": job["job_id"]}
 
-    return {"message": f"Deleted '{filename}' for issue and reindexed successfully."}
 
-
-@app.delete("/delete/feature")
+@app.delete("/delete/feature", status_code=202)
 async def delete_feature_file(filename: str = Query()):
     filename = secure_filename(filename)
     if not filename.endswith(".docx"):
@@ -256,39 +418,80 @@ async def delete_feature_file(filename: str = Query()):
     full_blob_name = FEATURE_UPLOADS_BLOB_PREFIX + filename
 
     try:
-        blob_client = container_client.get_blob_client(full_blob_name)
-        blob_client.delete_blob()
+        blob_client = get_container_client().get_blob_client(full_blob_name)
+        await run_in_threadpool(blob_client.delete_blob)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete blob: {str(e)}")
 
-    try:
-        build_index_fq(container_client)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to rebuild index after deletion: {str(e)}")
+    job = enqueue_index_job("feature", f"delete:{filename}")
+    return {"message": f"Deleted '{filename}' for feature. Reindex queued.", "job_id": job["job_id"]}
 
-    return {"message": f"Deleted '{filename}' for feature and reindexed successfully."}
-
-@app.post("/reindex/issue")
+@app.post("/reindex/issue", status_code=202)
 async def reindex_issue():
-    try:
-        result = build_index(container_client)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to rebuild issue index: {str(e)}")
-
-    if not result:
-        return {"message": "No documents found for issue in Azure Blob Storage."}
-    return {"message": "Issue index rebuilt successfully."}
+    job = enqueue_index_job("issue", "reindex")
+    return {"message": "Issue index rebuild queued.", "job_id": job["job_id"]}
 
-@app.post("/reindex/feature")
+@app.post("/reindex/feature", status_code=202)
 async def reindex_feature():
-    try:
-        result = build_index_fq(container_client)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to rebuild feature index: {str(e)}")
-
-    if not result:
-        return {"message": "No documents found for feature in Azure Blob Storage."}
-    return {"message": "Feature index rebuilt successfully."}
+    job = enqueue_index_job("feature", "reindex")
+    return {"message": "Feature index rebuild queued.", "job_id": job["job_id"]}
+
+@app.get("/versions/issue")
+def list_issue_index_versions():
+    return get_index_versions()
+
+@app.get("/versions/feature")
+def list_feature_index_versions():
+    return get_index_versions_fq()
+
+@app.post("/rollback/issue")
+async def rollback_issue_index(version_id: str | None = Query(None)):
+    published = await run_in_threadpool(synced_rollback, "issue", lambda: rollback_index(version_id))
+    if published is None:
+        raise HTTPException(status_code=404, detail="No issue index version to roll back to.")
+    return {"message": f"Issue index rolled back to version '{published}'.", "version_id": published}
+
+@app.post("/rollback/feature")
+async def rollback_feature_index(version_id: str | None = Query(None)):
+    published = await run_in_threadpool(synced_rollback, "feature", lambda: rollback_index_fq(version_id))
+    if published is None:
+        raise HTTPException(status_code=404, detail="No feature index version to roll back to.")
+    return {"message": f"Feature index rolled back to version '{published}'.", "version_id": published}
+
+@app.get("/api/stats/checkpoints")
+def checkpoint_stats():
+    return get_checkpoint_stats(get_checkpointer())
+
+@app.get("/api/stats/answer-cache")
+def answer_cache_stats():
+    return get_answer_cache_stats()
+
+@app.get("/api/stats/issue-match")
+def issue_match_stats():
+    return get_issue_match_stats()
+
+@app.get("/api/stats/feature-query")
+def feature_query_stats():
+    return get_feature_query_stats()
+
+@app.get("/api/stats/embeddings")
+def embedding_stats():
+    return get_embedding_stats()
+
+@app.get("/api/stats/index-sync")
+def index_sync_stats():
+    return get_index_sync_status()
+
+@app.get("/api/stats/zoho-token")
+def zoho_token_stats():
+    return get_zoho_token_stats()
+
+@app.get("/jobs/{job_id}")
+def get_index_job(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return job
 
 
 if __name__ == "__main__":
@@ -67,3 +67,15 @@ Only use feature_query_tool if the query is clearly about product capabilities (
 
 Always follow the instruction flow carefully to ensure a helpful and consistent user experience.
 """
+
+SUMMARY_PROMPT = """
+You are maintaining a running summary of a support conversation between a user and the Truce support assistant.
+
+Existing summary (may be empty):
+{summary}
+
+Older messages to fold into the summary:
+{transcript}
+
+Write an updated summary in at most {max_words} words. Keep the user's problem, product areas and error messages mentioned, resolutions already suggested, ticket IDs, email addresses and anything the user still expects. Do not add information that is not in the conversation.
+"""
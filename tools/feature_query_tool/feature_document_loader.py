@@ -0,0 +1,117 @@
+import os
+import re
+from llama_index.core.schema import Document
+from llama_index.core.node_parser import SentenceSplitter
+
+# Token size of the nodes a feature section is split into, and the overlap between consecutive ones.
+# Sections shorter than this stay one node, so retrieval returns whole, on-topic sections
+FEATURE_CHUNK_SIZE = int(os.getenv("FEATURE_CHUNK_SIZE", "512"))
+FEATURE_CHUNK_OVERLAP = int(os.getenv("FEATURE_CHUNK_OVERLAP", "64"))
+
+HEADING_PATH_SEPARATOR = " > "
+
+_HEADING_STYLE = re.compile(r"^Heading (\d+)$")
+
+# Shared by every build; SentenceSplitter keeps no per-document state
+_splitter = None
+
+
+def get_heading_level(paragraph):
+    """Outline level of a heading paragraph (Title is 0, Heading 1 is 1, ...), or None for body text."""
+    style_name = paragraph.style.name if paragraph.style is not None else ""
+    if style_name == "Title":
+        return 0
+    match = _HEADING_STYLE.match(style_name)
+    return int(match.group(1)) if match else None
+
+
+def _cell_text(cell):
+    return " ".join(cell.text.split()).replace("|", "\\|")
+
+
+def render_table(table):
+    """Renders a table as pipe-separated rows, the first one as header. Merged cells appear once."""
+    lines = []
+    for row_number, row in enumerate(table.rows):
+        cells = []
+        previous = None
+        for cell in row.cells:
+            # python-docx returns a horizontally merged cell once per grid column it spans
+            if previous is not None and cell._tc is previous._tc:
+                continue
+            cells.append(_cell_text(cell))
+            previous = cell
+        if not any(cells):
+            continue
+        lines.append("| " + " | ".join(cells) + " |")
+        if row_number == 0:
+            lines.append("|" + "---|" * len(cells))
+    return "\n".join(lines)
+
+
+def iter_docx_sections(docx):
+    """
+    Walks the paragraphs and tables of a python-docx Document in body order and yields
+    (heading path, section text) for every heading's content, starting with the text before the first heading.
+    """
+    headings = []
+    blocks = []
+
+    def flush():
+        text = "\n\n".join(block for block in blocks if block)
+        blocks.clear()
+        if text.strip():
+            return [title for _, title in headings], text
+        return None
+
+    for block in docx.iter_inner_content():
+        if hasattr(block, "rows"):
+            blocks.append(render_table(block))
+            continue
+
+        level = get_heading_level(block)
+        text = block.text.strip()
+        if level is None or not text:
+            blocks.append(text)
+            continue
+
+        section = flush()
+        if section is not None:
+            yield section
+        while headings and headings[-1][0] >= level:
+            headings.pop()
+        headings.append((level, text))
+
+    section = flush()
+    if section is not None:
+        yield section
+
+
+def parse_docx_sections(docx, blob_name):
+    """One document per section, carrying its heading path so retrieval and the LLM see where it comes from."""
+    documents = []
+    for section_number, (heading_path, text) in enumerate(iter_docx_sections(docx)):
+        documents.append(Document(
+            id_=f"{blob_name}#{section_number}",
+            text=text,
+            metadata={
+                "filename": blob_name,
+                "heading_path": HEADING_PATH_SEPARATOR.join(heading_path),
+                "section_number": section_number
+            },
+            excluded_embed_metadata_keys=["section_number"],
+            excluded_llm_metadata_keys=["section_number"]
+        ))
+    return documents
+
+
+def get_splitter():
+    global _splitter
+    if _splitter is None:
+        _splitter = SentenceSplitter(chunk_size=FEATURE_CHUNK_SIZE, chunk_overlap=FEATURE_CHUNK_OVERLAP)
+    return _splitter
+
+
+def documents_to_nodes_fq(documents):
+    """Splits section documents into nodes of at most FEATURE_CHUNK_SIZE tokens; each keeps its heading path."""
+    return get_splitter().get_nodes_from_documents(documents)
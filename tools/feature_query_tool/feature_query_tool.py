@@ -1,138 +1,216 @@
 import os
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, StorageContext, load_index_from_storage
-from llama_index.core import Settings
-from llama_index.llms.gemini import Gemini
-from llama_index.embeddings.gemini import GeminiEmbedding
-from llama_index.core.schema import Document
-from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core import VectorStoreIndex, load_index_from_storage
+from utils.rag_settings_utils import init_rag_settings
+from utils.vector_store_utils import create_storage_context
+from utils.ann_utils import ann_settings_from_env
+from utils.index_version_utils import (
+    migrate_legacy_layout, get_current_version_dir, get_version_dir, create_version_dir,
+    publish_version, unpublish_version, prune_versions, get_rollback_target, describe_versions
+)
+from utils.blob_utils import download_blob_to_buffer, iter_blob_results
+from utils.query_engine_utils import TokenBudgetPostprocessor, StageTimings, TimedQueryEngine
+from tools.feature_query_tool.feature_document_loader import parse_docx_sections, documents_to_nodes_fq
+from llama_index.core.postprocessor import SimilarityPostprocessor
+from llama_index.core.response_synthesizers import ResponseMode
 from azure.storage.blob import ContainerClient
-import shutil
-from io import BytesIO
 from docx import Document as DocxDocument
 
 
-api_key = os.getenv("GOOGLE_API_KEY")
 # index_storage_dir = "index_storage"
 # data_dir = "data"
 current_dir = os.path.dirname(os.path.abspath(__file__))  # this gives you .../tools/kb_tools
+# Root of the index versions; see utils/index_version_utils.py for the layout
 index_storage_dir = os.path.join(current_dir, "feature_indexing")
 data_dir = os.path.join(current_dir, "data")
-safety_settings = [
-    {
-        "category": "HARM_CATEGORY_DANGEROUS",
-        "threshold": "BLOCK_LOW_AND_ABOVE",
-    },
-    {
-        "category": "HARM_CATEGORY_HARASSMENT",
-        "threshold": "BLOCK_LOW_AND_ABOVE",
-    },
-    {
-        "category": "HARM_CATEGORY_HATE_SPEECH",
-        "threshold": "BLOCK_LOW_AND_ABOVE",
-    },
-    {
-        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-        "threshold": "BLOCK_LOW_AND_ABOVE",
-    },
-    {
-        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-        "threshold": "BLOCK_LOW_AND_ABOVE",
-    },
-]
-
-Settings.embed_model = GeminiEmbedding(
-    model_name=os.getenv('RAG_EMBEDDING_MODEL'), api_key=api_key
-)
-
-Settings.llm = Gemini(model_name=os.getenv('RAG_LLM'), api_key=api_key,safety_settings=safety_settings, temperature=0)
 
 
 FEATURE_UPLOADS_BLOB_PREFIX = "feature_query_data_uploads/"
 
+# "mmap" keeps embeddings in a memory-mapped float32 matrix, "simple" in LlamaIndex's JSON vector store
+FEATURE_VECTOR_STORE = os.getenv("FEATURE_VECTOR_STORE", "mmap")
+# Optional HNSW index for the mmap store: FEATURE_ANN_BACKEND=hnsw, tuned with FEATURE_ANN_EF_SEARCH / _M / _EF_CONSTRUCTION
+FEATURE_ANN_SETTINGS = ann_settings_from_env("FEATURE")
+
+# Nodes retrieved per query, and the cosine similarity below which a retrieved node is dropped (0 keeps all)
+FEATURE_TOP_K = int(os.getenv("FEATURE_TOP_K", "2"))
+FEATURE_SIMILARITY_CUTOFF = float(os.getenv("FEATURE_SIMILARITY_CUTOFF", "0"))
+# How the answer is synthesized: "compact" packs the nodes into as few LLM calls as fit the context window,
+# "tree_summarize" summarizes groups of nodes and then the summaries, "simple_summarize" always makes one
+# call (truncating what does not fit), "refine" makes one call per node
+FEATURE_RESPONSE_MODE = os.getenv("FEATURE_RESPONSE_MODE", "compact")
+# Prompt tokens of retrieved context per query; lower-ranked nodes beyond it are dropped (0 = no limit)
+FEATURE_MAX_CONTEXT_TOKENS = int(os.getenv("FEATURE_MAX_CONTEXT_TOKENS", "3000"))
+
 index = None
 chat_engine = None
+# Per-stage latency of feature queries, for GET /api/stats/feature-query
+query_timings = StageTimings()
+# Bumped whenever a different index is published, so caches built on the old one can tell
+index_version = 0
 
 
-def load_documents_from_azure_fq(container_client: ContainerClient, prefix=FEATURE_UPLOADS_BLOB_PREFIX):
-    documents = []
-    blobs = container_client.list_blobs(name_starts_with=prefix)
+def publish_index(new_index):
+    """Makes new_index (or None) the index every query uses."""
+    global index, chat_engine, index_version
+    index = new_index
+    chat_engine = make_query_engine(new_index) if new_index is not None else None
+    index_version += 1
+
+
+def make_query_engine(new_index):
+    node_postprocessors = []
+    if FEATURE_SIMILARITY_CUTOFF > 0:
+        node_postprocessors.append(SimilarityPostprocessor(similarity_cutoff=FEATURE_SIMILARITY_CUTOFF))
+    if FEATURE_MAX_CONTEXT_TOKENS > 0:
+        node_postprocessors.append(TokenBudgetPostprocessor(max_tokens=FEATURE_MAX_CONTEXT_TOKENS))
+    query_engine = new_index.as_query_engine(
+        similarity_top_k=FEATURE_TOP_K,
+        response_mode=ResponseMode(FEATURE_RESPONSE_MODE),
+        node_postprocessors=node_postprocessors
+    )
+    return TimedQueryEngine(query_engine, query_timings)
+
 
-    ALLOWED_EXTENSIONS = {".docx"}
+def get_feature_query_stats():
+    return {
+        "top_k": FEATURE_TOP_K,
+        "similarity_cutoff": FEATURE_SIMILARITY_CUTOFF,
+        "response_mode": FEATURE_RESPONSE_MODE,
+        "max_context_tokens": FEATURE_MAX_CONTEXT_TOKENS,
+        **query_timings.get_stats()
+    }
 
-    for blob in blobs:
+
+def get_feature_index_version():
+    return index_version
+
+
+ALLOWED_EXTENSIONS = {".docx"}
+
+
+def load_documents_from_blob_fq(container_client: ContainerClient, blob_name: str):
+    """Downloads a single .docx blob and returns one document per section. Returns None if the blob could not be used."""
+    try:
+        # python-docx opens the file as a zip archive, which needs a seekable buffer
+        docx = DocxDocument(download_blob_to_buffer(container_client, blob_name))
+        return parse_docx_sections(docx, blob_name)
+    except Exception as e:
+        print(f"Skipping file due to error: {blob_name} — {e}")
+        return None
+
+
+def iter_blob_documents_fq(container_client: ContainerClient, prefix=FEATURE_UPLOADS_BLOB_PREFIX):
+    """Yields (blob name, section documents) of the feature blobs as their concurrent downloads finish."""
+    blob_names = []
+    for blob in container_client.list_blobs(name_starts_with=prefix):
         ext = os.path.splitext(blob.name)[1].lower()
         if ext not in ALLOWED_EXTENSIONS:
             print(f"Skipping unsupported extension: {blob.name}")
             continue
+        blob_names.append(blob.name)
 
-        blob_client = container_client.get_blob_client(blob.name)
-        try:
-            raw_data = blob_client.download_blob().readall()
-            if ext == ".docx":
-                docx = DocxDocument(BytesIO(raw_data))
-                text = "\n".join([para.text for para in docx.paragraphs])
-            else:
-                text = raw_data.decode('utf-8')
+    for blob_name, documents in iter_blob_results(container_client, blob_names, load_documents_from_blob_fq):
+        if documents:
+            yield blob_name, documents
 
-            documents.append(Document(text=text, metadata={"filename": blob.name}))
 
-        except Exception as e:
-            print(f"Skipping file due to error: {blob.name} — {e}")
-            continue
+def iter_documents_from_azure_fq(container_client: ContainerClient, prefix=FEATURE_UPLOADS_BLOB_PREFIX):
+    for _, documents in iter_blob_documents_fq(container_client, prefix):
+        yield from documents
 
-    return documents
 
+def load_documents_from_azure_fq(container_client: ContainerClient, prefix=FEATURE_UPLOADS_BLOB_PREFIX):
+    return list(iter_documents_from_azure_fq(container_client, prefix))
 
 
-def build_index_fq(container_client, delete_old_index=True):
-    global index, chat_engine
 
-    print("Loading documents from Azure blob for reindexing Feature Query...")
+def _report_progress(progress_callback, **fields):
+    if progress_callback is not None:
+        progress_callback(**fields)
 
-    documents = load_documents_from_azure_fq(container_client)
-    if not documents:
+
+def _load_version_fq(version_dir):
+    init_rag_settings()
+    storage_context = create_storage_context(FEATURE_VECTOR_STORE, version_dir, **FEATURE_ANN_SETTINGS)
+    return load_index_from_storage(storage_context)
+
+
+def build_index_fq(container_client, delete_old_index=True, progress_callback=None):
+    """
+    Rebuilds the Feature Query index into a new version and publishes it atomically; queries keep
+    using the previous version until then. delete_old_index prunes versions beyond INDEX_KEEP_VERSIONS.
+    """
+    print("Loading documents from Azure blob for reindexing Feature Query...")
+    init_rag_settings()
+    migrate_legacy_layout(index_storage_dir)
+
+    # Each file is embedded as soon as it is parsed, while the next ones are still downloading
+    new_index = VectorStoreIndex(nodes=[], storage_context=create_storage_context(FEATURE_VECTOR_STORE, **FEATURE_ANN_SETTINGS))
+    documents_loaded = 0
+    for _, documents in iter_blob_documents_fq(container_client):
+        documents_loaded += len(documents)
+        _report_progress(progress_callback, documents_loaded=documents_loaded)
+        new_index.insert_nodes(documents_to_nodes_fq(documents))
+        _report_progress(progress_callback, documents_embedded=documents_loaded)
+
+    if not documents_loaded:
         print("No documents found in Azure blob folder for Feature Query, skipping index build.")
-        index = None
-        chat_engine = None
+        unpublish_version(index_storage_dir)
+        publish_index(None)
         return False
 
-    if delete_old_index and os.path.exists(index_storage_dir):
-        shutil.rmtree(index_storage_dir)
+    version_id, version_dir = create_version_dir(index_storage_dir)
+    new_index.storage_context.persist(persist_dir=version_dir)
+    _report_progress(progress_callback, persisted=True)
 
-    index = VectorStoreIndex.from_documents(documents)
-    index.storage_context.persist(persist_dir=index_storage_dir)
-
-    chat_engine = index.as_query_engine()
-    print("Index completed successfully for Feature Query.")
-    return True 
+    publish_version(index_storage_dir, version_id)
+    publish_index(new_index)
+    if delete_old_index:
+        prune_versions(index_storage_dir)
+    print(f"Index completed successfully for Feature Query (version {version_id}).")
+    return True
 
 
 def load_existing_index_fq(container_client):
-    global index, chat_engine
-
     blobs = list(container_client.list_blobs(name_starts_with=FEATURE_UPLOADS_BLOB_PREFIX))
     if not blobs:
         print("No files found in Azure blob storage folder in Feature Query, skipping loading existing index.")
-        index = None
-        chat_engine = None
+        publish_index(None)
         return
 
-    if os.path.exists(index_storage_dir) and os.listdir(index_storage_dir):
+    migrate_legacy_layout(index_storage_dir)
+    version_dir = get_current_version_dir(index_storage_dir)
+    if version_dir is not None:
         try:
             print("Loading existing index from local storage for Feature Query...")
-            storage_context = StorageContext.from_defaults(persist_dir=index_storage_dir)
-            index = load_index_from_storage(storage_context)
-
-            chat_engine = index.as_query_engine()
+            publish_index(_load_version_fq(version_dir))
             print("Index and chat engine loaded successfully for Feature Query.")
         except Exception as e:
             print(f"Failed to load index for Feature Query: {e}")
-            index = None
-            chat_engine = None
+            publish_index(None)
     else:
         print("No existing local index found for Feature Query. Please run build_index() first.")
-        index = None
-        chat_engine = None
+        publish_index(None)
+
+
+def get_index_versions_fq():
+    return describe_versions(index_storage_dir)
+
+
+def rollback_index_fq(version_id=None):
+    """
+    Publishes version_id, or the version before the current one, and serves it.
+    Returns the published version id, or None if there is no such version.
+    """
+    target = get_rollback_target(index_storage_dir, version_id)
+    if target is None:
+        return None
+    # Loaded before CURRENT moves, so a version that cannot be loaded is never published
+    loaded_index = _load_version_fq(get_version_dir(index_storage_dir, target))
+    publish_version(index_storage_dir, target)
+    publish_index(loaded_index)
+    print(f"Feature Query index rolled back to version {target}.")
+    return target
 
 
 def get_feature_chat_engine():
@@ -0,0 +1,118 @@
+import io
+import os
+import hashlib
+import pandas as pd
+from llama_index.core.schema import Document, TextNode, NodeRelationship
+
+# Rows read from a CSV at a time, so a large ticket export never sits in memory as one DataFrame
+ISSUE_CSV_CHUNK_ROWS = int(os.getenv("ISSUE_CSV_CHUNK_ROWS", "20000"))
+
+REQUIRED_COLUMNS = ["issue", "resolution"]
+
+# What a row's document is made of: "issue" embeds the problem description and carries the resolution
+# as metadata, "issue_category" also embeds the category, "resolution" embeds the answer (the original layout)
+ISSUE_DOC_LAYOUT = os.getenv("ISSUE_DOC_LAYOUT", "issue")
+# Stored in the index manifest; bump it whenever the documents built from a row change (text, metadata, ids),
+# so existing indexes are rebuilt instead of mixing old and new rows. 2: no "category" key for rows without one
+ISSUE_DOC_FORMAT_VERSION = 2
+
+# layout -> (column used as document text, metadata keys the embedding sees, metadata keys the LLM sees)
+DOC_LAYOUTS = {
+    "issue": ("issue", [], ["resolution", "category"]),
+    "issue_category": ("issue", ["category"], ["resolution", "category"]),
+    "resolution": ("resolution", ["issue", "category", "source_file", "row_number"], ["issue", "category", "source_file", "row_number"]),
+}
+
+
+def compute_row_hash(issue_text, resolution_text, category_text):
+    """Content hash of one issue-resolution row, independent of its position in the CSV."""
+    content = "\x1f".join(str(value) for value in (issue_text, resolution_text, category_text))
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def make_issue_doc_id(source_file, row_hash):
+    """Stable document ID, so an unchanged row keeps its vectors across rebuilds."""
+    return f"{source_file}:{row_hash}"
+
+
+def documents_from_frame(df, blob_name, layout=ISSUE_DOC_LAYOUT):
+    """
+    Builds one document per row of a chunk that already has the expected columns, following DOC_LAYOUTS[layout].
+    Missing issue text becomes "", a missing or blank category leaves the category key out, and rows without a
+    resolution are dropped since there is nothing to return for them. Layouts that embed
+    the issue also drop rows without issue text, since there is nothing to match them on.
+    """
+    text_column, embed_keys, llm_keys = DOC_LAYOUTS[layout]
+    df = df[df["resolution"].notna() & (df["resolution"].str.strip() != "")]
+    if text_column == "issue":
+        df = df[df["issue"].notna() & (df["issue"].str.strip() != "")]
+    issues = df["issue"].fillna("").tolist()
+    resolutions = df["resolution"].tolist()
+    if "category" in df.columns:
+        categories = df["category"].astype(object).where(df["category"].notna(), None).tolist()
+    else:
+        categories = [None] * len(df)
+    row_numbers = df.index.tolist()
+
+    metadata_keys = ["issue", "category", "source_file", "row_number", "row_hash"]
+    if text_column != "resolution":
+        metadata_keys.append("resolution")
+    excluded_embed_keys = [key for key in metadata_keys if key not in embed_keys]
+    excluded_llm_keys = [key for key in metadata_keys if key not in llm_keys]
+
+    documents = []
+    for issue_text, resolution_text, category_text, row_number in zip(issues, resolutions, categories, row_numbers):
+        row_hash = compute_row_hash(issue_text, resolution_text, category_text)
+        metadata = {
+            "issue": issue_text,
+            "source_file": blob_name,
+            "row_number": row_number,
+            "row_hash": row_hash
+        }
+        # Otherwise the LLM and the embedding would see "category: None"
+        if category_text is not None and category_text.strip():
+            metadata["category"] = category_text
+        if text_column != "resolution":
+            metadata["resolution"] = resolution_text
+        documents.append(Document(
+            id_=make_issue_doc_id(blob_name, row_hash),
+            text=issue_text if text_column == "issue" else resolution_text,
+            metadata=metadata,
+            excluded_embed_metadata_keys=excluded_embed_keys,
+            excluded_llm_metadata_keys=excluded_llm_keys
+        ))
+    return documents
+
+
+def documents_to_nodes(documents):
+    """
+    One node per row instead of running the sentence splitter: rows are short, and the
+    resolution carried in metadata must reach the engine whole.
+    """
+    return [
+        TextNode(
+            text=doc.text,
+            metadata=doc.metadata,
+            excluded_embed_metadata_keys=doc.excluded_embed_metadata_keys,
+            excluded_llm_metadata_keys=doc.excluded_llm_metadata_keys,
+            relationships={NodeRelationship.SOURCE: doc.as_related_node_info()}
+        )
+        for doc in documents
+    ]
+
+
+def iter_issue_document_chunks(csv_content, blob_name, chunk_rows=ISSUE_CSV_CHUNK_ROWS, layout=ISSUE_DOC_LAYOUT):
+    """
+    Yields the documents of a CSV, given as a string or a binary stream, chunk_rows rows at a time.
+    Returns before yielding anything when the CSV does not have the expected columns.
+    """
+    if isinstance(csv_content, str):
+        csv_content = io.StringIO(csv_content)
+
+    # Every column is read as text so values hash the same whatever dtype pandas would infer
+    reader = pd.read_csv(csv_content, encoding="utf-8", dtype=str, chunksize=chunk_rows)
+    for chunk_number, chunk in enumerate(reader):
+        if chunk_number == 0 and not all(col in chunk.columns for col in REQUIRED_COLUMNS):
+            print(f"Warning: CSV '{blob_name}' missing expected columns ('issue', 'resolution'). Skipping.")
+            return
+        yield documents_from_frame(chunk, blob_name, layout)
@@ -1,72 +1,109 @@
 import os
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, StorageContext, load_index_from_storage
-from llama_index.core import Settings
-import os
-import io
+import json
+import time
+import threading
 import pandas as pd
-import shutil
+from collections import OrderedDict
 from azure.storage.blob import ContainerClient
-from llama_index.core.schema import Document
-from llama_index.core import VectorStoreIndex, StorageContext, load_index_from_storage
-from llama_index.core.memory import ChatMemoryBuffer
-from llama_index.llms.gemini import Gemini
-from llama_index.embeddings.gemini import GeminiEmbedding
+from llama_index.core import VectorStoreIndex, load_index_from_storage
 from llama_index.core.memory import ChatMemoryBuffer
-from llama_index.readers.azstorage_blob import AzStorageBlobReader
+from llama_index.core.chat_engine import ContextChatEngine
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.schema import QueryBundle
+from utils.rag_settings_utils import init_rag_settings
+from utils.vector_store_utils import create_storage_context
+from utils.ann_utils import ann_settings_from_env
+from utils.blob_utils import open_blob_stream, iter_blob_chunks
+from utils.index_version_utils import (
+    migrate_legacy_layout, get_current_version_dir, get_version_dir, create_version_dir,
+    publish_version, unpublish_version, prune_versions, get_rollback_target, describe_versions
+)
+from utils.hybrid_retrieval_utils import BM25Index, HybridRetriever, StaticRetriever
+from tools.issue_resolution_matching_tool.issue_document_loader import (
+    ISSUE_DOC_LAYOUT, ISSUE_DOC_FORMAT_VERSION, make_issue_doc_id, iter_issue_document_chunks, documents_to_nodes
+)
 
 
-api_key = os.getenv("GOOGLE_API_KEY")
 current_dir = os.path.dirname(os.path.abspath(__file__))
+# Root of the index versions; see utils/index_version_utils.py for the layout
 index_storage_dir = os.path.join(current_dir, "issue_resolution_indexing")
+# Document layout and format version, blob ETags and row hashes of everything embedded in a version, stored inside it
+MANIFEST_FILENAME = "issue_resolution_manifest.json"
+# Where the manifest lived before indexes were versioned
+legacy_manifest_path = os.path.join(current_dir, MANIFEST_FILENAME)
 data_dir = os.path.join(current_dir, "ir_data")
-safety_settings = [
-    {
-        "category": "HARM_CATEGORY_DANGEROUS",
-        "threshold": "BLOCK_LOW_AND_ABOVE",
-    },
-    {
-        "category": "HARM_CATEGORY_HARASSMENT",
-        "threshold": "BLOCK_LOW_AND_ABOVE",
-    },
-    {
-        "category": "HARM_CATEGORY_HATE_SPEECH",
-        "threshold": "BLOCK_LOW_AND_ABOVE",
-    },
-    {
-        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-        "threshold": "BLOCK_LOW_AND_ABOVE",
-    },
-    {
-        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-        "threshold": "BLOCK_LOW_AND_ABOVE",
-    },
-]
-
-Settings.embed_model = GeminiEmbedding(
-    model_name=os.getenv('RAG_EMBEDDING_MODEL'), api_key=api_key
-)
-
-Settings.llm = Gemini(model_name=os.getenv('RAG_LLM'), api_key=api_key,safety_settings=safety_settings, temperature=0)
 
 ISSUE_UPLOADS_BLOB_PREFIX = "issue_resolution_data_uploads/"
 
+# "mmap" keeps embeddings in a memory-mapped float32 matrix, "simple" in LlamaIndex's JSON vector store
+ISSUE_VECTOR_STORE = os.getenv("ISSUE_VECTOR_STORE", "mmap")
+# Optional HNSW index for the mmap store: ISSUE_ANN_BACKEND=hnsw, tuned with ISSUE_ANN_EF_SEARCH / _M / _EF_CONSTRUCTION
+ISSUE_ANN_SETTINGS = ann_settings_from_env("ISSUE")
+
+# "thread" keeps a chat memory per conversation, "stateless" answers every query from retrieval alone
+ISSUE_CHAT_MODE = os.getenv("ISSUE_CHAT_MODE", "thread")
+ISSUE_CHAT_MEMORY_TOKEN_LIMIT = int(os.getenv("ISSUE_CHAT_MEMORY_TOKEN_LIMIT", "4000"))
+ISSUE_CHAT_MAX_THREADS = int(os.getenv("ISSUE_CHAT_MAX_THREADS", "256"))
+ISSUE_CHAT_THREAD_TTL_SECONDS = int(os.getenv("ISSUE_CHAT_THREAD_TTL_SECONDS", "1800"))
+
+# "hybrid" fuses BM25 over issue + resolution text with vector search, "vector" uses vector search only
+ISSUE_RETRIEVAL_MODE = os.getenv("ISSUE_RETRIEVAL_MODE", "hybrid")
+# Nodes handed to the chat engine
+ISSUE_RETRIEVAL_TOP_K = int(os.getenv("ISSUE_RETRIEVAL_TOP_K", "2"))
+# Candidates taken from each of the vector and BM25 rankings before fusion
+ISSUE_HYBRID_TOP_K = int(os.getenv("ISSUE_HYBRID_TOP_K", "10"))
+ISSUE_RRF_K = int(os.getenv("ISSUE_RRF_K", "60"))
+
+# Cosine similarity of the best vector match at or above which its resolution is returned without the LLM
+ISSUE_DIRECT_RETURN_THRESHOLD = float(os.getenv("ISSUE_DIRECT_RETURN_THRESHOLD", "0.85"))
+# Below this, and with no BM25 hit either, the query is answered as "no match" without the LLM;
+# in between the LLM decides
+ISSUE_NO_MATCH_FLOOR = float(os.getenv("ISSUE_NO_MATCH_FLOOR", "0.55"))
+NO_RESOLUTION_FOUND = "No resolution found in the documents."
+
+ISSUE_RESOLUTION_SYSTEM_PROMPT = (
+    """You are a highly specialized document assistant. Your only task is to precisely extract and return the 'resolution' section from the provided context.
+
+    **Crucial Rules to Follow Meticulously:**
+    1.  **Extract ONLY the resolution.** Do not include the issue description, category, summaries, or any introductory/concluding sentences.
+    2.  Return the resolution text exactly as it appears in the source, word for word, including any numbering or formatting.
+    3.  **STRICTLY, IF THE PROVIDED CONTEXT DOES NOT CONTAIN A CLEAR, DIRECT RESOLUTION TO THE USER'S EXACT QUESTION, YOUR ONLY RESPONSE MUST BE: "No resolution found in the documents."** Do not attempt to guess, summarize, or create any other text.
+    4.  Strictly avoid hallucination or generating any text not present in the original resolution.
+
+    **Example of desired behavior (if no resolution is found):**
+    User Query: "How do I fix issues with my new biometric scanner?"
+    (If no resolution for biometric scanners is in your documents)
+    Your Response: "No resolution found in the documents."
+    """
+)
+
 index = None
-chat_engine = None
+# BM25 side of the hybrid retriever, persisted next to the vector index
+bm25_index = None
+# One retriever shared by every conversation; chat engines are cheap wrappers around it
+retriever = None
+# Bumped whenever a different index is published, so caches built on the old one can tell
+index_version = 0
+
+# thread_id -> (ChatMemoryBuffer, last used timestamp), least recently used first
+_thread_memories = OrderedDict()
+_thread_memories_lock = threading.Lock()
+
+# How issue queries were answered, and a histogram of top-1 scores (0.05 wide buckets) to calibrate the band with
+_match_stats = {"direct": 0, "no_match": 0, "llm": 0, "cached": 0}
+_match_score_buckets = {}
+_match_stats_lock = threading.Lock()
+
 
+# A CSV that downloaded but raises one of these cannot be parsed; it then contributes no rows
+CSV_PARSE_ERRORS = (pd.errors.EmptyDataError, pd.errors.ParserError, UnicodeDecodeError)
 
-def clean_document_metadata(document):
-    """Clean document metadata to remove non-serializable objects"""
-    if hasattr(document, 'metadata') and document.metadata:
-        cleaned_metadata = {}
-        for key, value in document.metadata.items():
 
-            if isinstance(value, (str, int, float, bool, list, dict, type(None))):
-                cleaned_metadata[key] = value
-            else:
-                
-                cleaned_metadata[key] = str(value)
-        document.metadata = cleaned_metadata
-    return document
+def iter_issue_blob_chunks(container_client: ContainerClient, blob_name: str):
+    """Streams a single CSV blob and yields its documents ISSUE_CSV_CHUNK_ROWS rows at a time."""
+    print(f"Processing CSV blob: {blob_name}")
+    with open_blob_stream(container_client, blob_name) as csv_stream:
+        yield from iter_issue_document_chunks(csv_stream, blob_name)
 
 
 def load_documents_from_azure_with_reader(connection_string: str, container_name: str, prefix: str = ISSUE_UPLOADS_BLOB_PREFIX):
@@ -76,7 +113,7 @@ def load_documents_from_azure_with_reader(connection_string: str, container_name
     Assumes the CSV has columns: 'issue', 'category', 'resolution'.
     """
     print(f"Attempting to load documents from Azure Blob: Container='{container_name}', Prefix='{prefix}'")
-    
+
     try:
         blob_service_client = ContainerClient.from_connection_string(
             conn_str=connection_string,
@@ -87,45 +124,17 @@ def load_documents_from_azure_with_reader(connection_string: str, container_name
         return []
 
     all_parsed_documents = []
-    
-    blob_list = blob_service_client.list_blobs(name_starts_with=prefix)
-    
-    for blob in blob_list:
-        if blob.name.endswith('.csv'):
-            print(f"Processing CSV blob: {blob.name}")
-            try:
-                blob_client = blob_service_client.get_blob_client(blob.name)
-                download_stream = blob_client.download_blob()
-                csv_content = download_stream.readall().decode('utf-8')
-
-                df = pd.read_csv(io.StringIO(csv_content))
-                print(f"DataFrame loaded. Number of rows: {len(df)}")
-
-                
-                required_columns = ['issue', 'resolution']
-                if not all(col in df.columns for col in required_columns):
-                    print(f"Warning: CSV '{blob.name}' missing expected columns ('issue', 'resolution'). Skipping.")
-                    continue
-
-                for index, row in df.iterrows():
-                    issue_text = row['issue']
-                    resolution_text = row['resolution']
-                    category_text = row['category'] if 'category' in df.columns else None 
-
-                    doc = Document(
-                        text=resolution_text,
-                        metadata={
-                            "issue": issue_text,
-                            "category": category_text,
-                            "source_file": blob.name,
-                            "row_number": index
-                        }
-                    )
-                    all_parsed_documents.append(clean_document_metadata(doc))
-
-            except Exception as e:
-                print(f"Error processing blob '{blob.name}': {e}")
-                continue
+
+    blob_names = (
+        blob.name for blob in blob_service_client.list_blobs(name_starts_with=prefix)
+        if blob.name.endswith('.csv')
+    )
+
+    for kind, blob_name, value in iter_blob_chunks(blob_service_client, blob_names, iter_issue_blob_chunks):
+        if kind == "chunk":
+            all_parsed_documents.extend(value)
+        elif kind == "error":
+            print(f"Error processing blob '{blob_name}': {value}")
 
     print(f"Successfully loaded and parsed {len(all_parsed_documents)} documents from Azure Blob Storage.")
     if all_parsed_documents:
@@ -134,104 +143,416 @@ def load_documents_from_azure_with_reader(connection_string: str, container_name
     return all_parsed_documents
 
 
-def build_index(container_client, delete_old_index=True):
-    global index, chat_engine
+def load_manifest(version_dir):
+    """Returns the manifest of the index persisted in version_dir, or None if there is none."""
+    manifest_path = os.path.join(version_dir, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Failed to read Issue Resolution manifest, a full rebuild will be done: {e}")
+        return None
 
-    print("Loading documents from Azure blob for reindexing Issue Resolution...")
 
-    documents = load_documents_from_azure_with_reader(
-        connection_string=os.getenv("AZURE_STORAGE_CONNECTION_STRING"),
-        container_name=os.getenv("AZURE_CONTAINER_NAME"),
-        prefix=ISSUE_UPLOADS_BLOB_PREFIX
+def save_manifest(manifest, version_dir):
+    manifest_path = os.path.join(version_dir, MANIFEST_FILENAME)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def bm25_text(node):
+    """Text a node is keyword-matched on: the issue it answers plus its resolution."""
+    return f"{node.metadata.get('issue', '')}\n{get_node_resolution(node)}"
+
+
+def get_node_resolution(node):
+    """The resolution a node carries: its metadata payload, or its text in the "resolution" layout."""
+    return node.metadata.get("resolution", node.get_content())
+
+
+def build_bm25_from_docstore(docstore):
+    bm25 = BM25Index()
+    for node in docstore.docs.values():
+        bm25.add(node.node_id, bm25_text(node))
+    return bm25
+
+
+def _load_bm25(current_index, version_dir):
+    """Returns the BM25 index persisted with current_index, rebuilding it locally if it was never persisted."""
+    try:
+        bm25 = BM25Index.load(version_dir)
+        if bm25 is not None:
+            return bm25
+    except Exception as e:
+        print(f"Failed to load Issue Resolution BM25 index, rebuilding it from the docstore: {e}")
+    return build_bm25_from_docstore(current_index.docstore)
+
+
+def make_retriever(new_index, new_bm25_index):
+    vector_retriever = new_index.as_retriever(
+        similarity_top_k=ISSUE_HYBRID_TOP_K if ISSUE_RETRIEVAL_MODE == "hybrid" else ISSUE_RETRIEVAL_TOP_K
+    )
+    if ISSUE_RETRIEVAL_MODE != "hybrid" or new_bm25_index is None:
+        return vector_retriever
+    return HybridRetriever(
+        vector_retriever,
+        new_bm25_index,
+        new_index.docstore,
+        top_k=ISSUE_RETRIEVAL_TOP_K,
+        sparse_top_k=ISSUE_HYBRID_TOP_K,
+        rrf_k=ISSUE_RRF_K
     )
 
-    if not documents:
-        print("No documents found in Azure blob folder for Issue Resolution, skipping index build.")
-        index = None
-        chat_engine = None
 
-        if delete_old_index and os.path.exists(index_storage_dir):
-            shutil.rmtree(index_storage_dir)
+def publish_index(new_index, new_bm25_index=None):
+    """Makes new_index (or None) and its BM25 index the ones every query uses."""
+    global index, bm25_index, retriever, index_version
+    index = new_index
+    bm25_index = new_bm25_index
+    retriever = make_retriever(new_index, new_bm25_index) if new_index is not None else None
+    index_version += 1
 
-        return False
 
-    index = VectorStoreIndex.from_documents(documents)
-    index.storage_context.persist(persist_dir=index_storage_dir)
+def get_issue_index_version():
+    return index_version
 
-    memory = ChatMemoryBuffer.from_defaults(token_limit=4000)
-    chat_engine = index.as_chat_engine(
-        chat_mode="context",
-        memory=memory,
-       system_prompt=(
-    """You are a highly specialized document assistant. Your only task is to precisely extract and return the 'resolution' section from the provided context.
-    
-    **Crucial Rules to Follow Meticulously:**
-    1.  **Extract ONLY the resolution.** Do not include the issue description, category, summaries, or any introductory/concluding sentences.
-    2.  Return the resolution text exactly as it appears in the source, word for word, including any numbering or formatting.
-    3.  **STRICTLY, IF THE PROVIDED CONTEXT DOES NOT CONTAIN A CLEAR, DIRECT RESOLUTION TO THE USER'S EXACT QUESTION, YOUR ONLY RESPONSE MUST BE: "No resolution found in the documents."** Do not attempt to guess, summarize, or create any other text.
-    4.  Strictly avoid hallucination or generating any text not present in the original resolution.
-    
-    **Example of desired behavior (if no resolution is found):**
-    User Query: "How do I fix issues with my new biometric scanner?"
-    (If no resolution for biometric scanners is in your documents)
-    Your Response: "No resolution found in the documents."
+
+def is_issue_index_loaded():
+    return retriever is not None
+
+
+def _get_thread_memory(thread_id):
+    """Returns the chat memory of a conversation, evicting idle and least recently used ones."""
+    now = time.time()
+    with _thread_memories_lock:
+        expired = [
+            key for key, (_, last_used) in _thread_memories.items()
+            if now - last_used > ISSUE_CHAT_THREAD_TTL_SECONDS
+        ]
+        for key in expired:
+            del _thread_memories[key]
+
+        if thread_id in _thread_memories:
+            memory, _ = _thread_memories.pop(thread_id)
+        else:
+            memory = ChatMemoryBuffer.from_defaults(token_limit=ISSUE_CHAT_MEMORY_TOKEN_LIMIT)
+        _thread_memories[thread_id] = (memory, now)
+
+        while len(_thread_memories) > ISSUE_CHAT_MAX_THREADS:
+            _thread_memories.popitem(last=False)
+        return memory
+
+
+def _load_version(version_dir):
+    """Loads the index and BM25 index persisted in version_dir."""
+    init_rag_settings()
+    storage_context = create_storage_context(ISSUE_VECTOR_STORE, version_dir, **ISSUE_ANN_SETTINGS)
+    loaded_index = load_index_from_storage(storage_context)
+    return loaded_index, _load_bm25(loaded_index, version_dir)
+
+
+def _load_index_for_update(manifest, version_dir):
     """
-)
+    Returns a private copy of the published index and its BM25 index for an incremental build,
+    or (None, None) if a full rebuild is needed. The served index is never modified in place.
+    """
+    if manifest is None or version_dir is None:
+        return None, None
+    try:
+        return _load_version(version_dir)
+    except Exception as e:
+        print(f"Failed to load existing Issue Resolution index, a full rebuild will be done: {e}")
+        return None, None
+
+
+def _delete_issue_document(current_index, bm25, doc_id):
+    ref_doc_info = current_index.docstore.get_ref_doc_info(doc_id)
+    if ref_doc_info is not None:
+        for node_id in ref_doc_info.node_ids:
+            bm25.remove(node_id)
+    current_index.delete_ref_doc(doc_id, delete_from_docstore=True)
+
+
+def _report_progress(progress_callback, **fields):
+    if progress_callback is not None:
+        progress_callback(**fields)
+
+
+def build_index(container_client, delete_old_index=True, full_rebuild=False, progress_callback=None):
+    """
+    Brings the Issue Resolution index in line with the CSVs in Azure blob storage.
+
+    Only blobs whose ETag changed since the last build are downloaded, and only rows whose
+    content hash is new are embedded. Vectors of removed rows and removed files are deleted.
+    Changed blobs are downloaded concurrently and embedded chunk by chunk as they are parsed.
+    The result is persisted as a new version and published atomically; queries keep using the
+    previous version until then. delete_old_index prunes versions beyond INDEX_KEEP_VERSIONS.
+    Pass full_rebuild=True to ignore the manifest and re-embed everything.
+    progress_callback, if given, is called with documents_loaded/documents_embedded/persisted updates.
+    """
+    print("Loading documents from Azure blob for reindexing Issue Resolution...")
+    init_rag_settings()
+
+    migrate_legacy_layout(index_storage_dir, [legacy_manifest_path])
+    current_version_dir = get_current_version_dir(index_storage_dir)
+    manifest = None if full_rebuild or current_version_dir is None else load_manifest(current_version_dir)
+    # Manifests written before layouts existed were built with the "resolution" layout
+    if manifest is not None and manifest.get("layout", "resolution") != ISSUE_DOC_LAYOUT:
+        print(f"Issue Resolution document layout changed to '{ISSUE_DOC_LAYOUT}', doing a full rebuild.")
+        manifest = None
+    # Manifests written before format versions existed are version 1
+    elif manifest is not None and manifest.get("format", 1) != ISSUE_DOC_FORMAT_VERSION:
+        print(f"Issue Resolution document format changed to version {ISSUE_DOC_FORMAT_VERSION}, doing a full rebuild.")
+        manifest = None
+    current_index, bm25 = _load_index_for_update(manifest, current_version_dir)
+    if current_index is None:
+        manifest = {"blobs": {}}
+        # Filled blob by blob below, so embedding overlaps with the downloads still in flight
+        current_index = VectorStoreIndex(nodes=[], storage_context=create_storage_context(ISSUE_VECTOR_STORE, **ISSUE_ANN_SETTINGS))
+        bm25 = BM25Index()
+
+    previous_blobs = manifest.get("blobs", {})
+    next_blobs = {}
+    changed_etags = {}
+    documents_loaded = 0
+    documents_embedded = 0
+    documents_deleted = 0
+
+    for blob in container_client.list_blobs(name_starts_with=ISSUE_UPLOADS_BLOB_PREFIX):
+        if not blob.name.endswith('.csv'):
+            continue
+
+        previous = previous_blobs.get(blob.name)
+        if previous and previous.get("etag") == blob.etag:
+            next_blobs[blob.name] = previous
+        else:
+            changed_etags[blob.name] = blob.etag
+
+    # Row hashes of the blobs being read: "old" from the manifest, "new" seen in this build so far
+    blob_hashes = {}
+    for kind, blob_name, value in iter_blob_chunks(container_client, changed_etags, iter_issue_blob_chunks):
+        previous = previous_blobs.get(blob_name)
+        if blob_name not in blob_hashes:
+            blob_hashes[blob_name] = {"old": set(previous["row_hashes"]) if previous else set(), "new": set()}
+        hashes = blob_hashes[blob_name]
+
+        if kind == "chunk":
+            # Each chunk is embedded and released before the next one, so memory does not grow with the file
+            documents_loaded += len(value)
+            _report_progress(progress_callback, documents_loaded=documents_loaded)
+            documents_to_insert = {}
+            for doc in value:
+                row_hash = doc.metadata["row_hash"]
+                if row_hash not in hashes["old"] and row_hash not in hashes["new"]:
+                    documents_to_insert[doc.id_] = doc
+                hashes["new"].add(row_hash)
+
+            if documents_to_insert:
+                nodes = documents_to_nodes(list(documents_to_insert.values()))
+                current_index.insert_nodes(nodes)
+                for node in nodes:
+                    bm25.add(node.node_id, bm25_text(node))
+                documents_embedded += len(documents_to_insert)
+                _report_progress(progress_callback, documents_embedded=documents_embedded)
+            continue
+
+        del blob_hashes[blob_name]
+        download_failed = kind == "error" and not isinstance(value, CSV_PARSE_ERRORS)
+        if download_failed:
+            # Keep serving what was indexed before rather than dropping the file
+            print(f"Error processing blob '{blob_name}': {value}")
+            kept_hashes = hashes["old"]
+        elif kind == "error":
+            print(f"Warning: CSV '{blob_name}' could not be parsed ({value}); it contributes no documents.")
+            kept_hashes = set()
+        else:
+            kept_hashes = hashes["new"]
+            print(f"CSV '{blob_name}' parsed. Number of documents: {len(kept_hashes)}")
+            if not kept_hashes:
+                print(f"Warning: CSV '{blob_name}' has no usable issue rows; it contributes no documents.")
+
+        # Rows gone from the file, and rows this build inserted for a file it then could not use
+        for row_hash in (hashes["old"] | hashes["new"]) - kept_hashes:
+            _delete_issue_document(current_index, bm25, make_issue_doc_id(blob_name, row_hash))
+            documents_deleted += 1
+
+        if not download_failed:
+            next_blobs[blob_name] = {"etag": changed_etags[blob_name], "row_hashes": sorted(kept_hashes)}
+        elif previous:
+            next_blobs[blob_name] = previous
+
+    for blob_name, previous in previous_blobs.items():
+        if blob_name not in next_blobs:
+            for row_hash in previous["row_hashes"]:
+                _delete_issue_document(current_index, bm25, make_issue_doc_id(blob_name, row_hash))
+                documents_deleted += 1
+
+    if not any(entry["row_hashes"] for entry in next_blobs.values()):
+        print("No documents found in Azure blob folder for Issue Resolution, skipping index build.")
+        unpublish_version(index_storage_dir)
+        publish_index(None)
+        return False
+
+    print(
+        f"Issue Resolution changes: {documents_embedded} rows embedded, "
+        f"{documents_deleted} rows deleted."
     )
-    print("Index completed successfully for Issue Resolution.")
+
+    version_id, version_dir = create_version_dir(index_storage_dir)
+    current_index.storage_context.persist(persist_dir=version_dir)
+    bm25.persist(version_dir)
+    save_manifest({"layout": ISSUE_DOC_LAYOUT, "format": ISSUE_DOC_FORMAT_VERSION, "blobs": next_blobs}, version_dir)
+    _report_progress(progress_callback, persisted=True)
+
+    publish_version(index_storage_dir, version_id)
+    publish_index(current_index, bm25)
+    if delete_old_index:
+        prune_versions(index_storage_dir)
+    print(f"Index completed successfully for Issue Resolution (version {version_id}).")
     return True
 
 
 def load_existing_index(container_client):
-    global index, chat_engine
-
     blobs = list(container_client.list_blobs(name_starts_with=ISSUE_UPLOADS_BLOB_PREFIX))
     if not blobs:
         print("No files found in Azure blob storage folder in Issue Resolution, skipping loading existing index.")
-        index = None
-        chat_engine = None
+        publish_index(None)
         return
 
-    if os.path.exists(index_storage_dir) and os.listdir(index_storage_dir):
+    migrate_legacy_layout(index_storage_dir, [legacy_manifest_path])
+    version_dir = get_current_version_dir(index_storage_dir)
+    if version_dir is not None:
         try:
             print("Loading existing index from local storage for Issue Resolution...")
-            storage_context = StorageContext.from_defaults(persist_dir=index_storage_dir)
-            index = load_index_from_storage(storage_context)
-
-            memory = ChatMemoryBuffer.from_defaults(token_limit=4000)
-            chat_engine = index.as_chat_engine(
-                chat_mode="context",
-                memory=memory,
-                system_prompt=(
-    """You are a highly specialized document assistant. Your only task is to precisely extract and return the 'resolution' section from the provided context.
-    
-    **Crucial Rules to Follow Meticulously:**
-    1.  **Extract ONLY the resolution.** Do not include the issue description, category, summaries, or any introductory/concluding sentences.
-    2.  Return the resolution text exactly as it appears in the source, word for word, including any numbering or formatting.
-    3.  **STRICTLY, IF THE PROVIDED CONTEXT DOES NOT CONTAIN A CLEAR, DIRECT RESOLUTION TO THE USER'S EXACT QUESTION, YOUR ONLY RESPONSE MUST BE: "No resolution found in the documents."** Do not attempt to guess, summarize, or create any other text.
-    4.  Strictly avoid hallucination or generating any text not present in the original resolution.
-    
-    **Example of desired behavior (if no resolution is found):**
-    User Query: "How do I fix issues with my new biometric scanner?"
-    (If no resolution for biometric scanners is in your documents)
-    Your Response: "No resolution found in the documents."
-    """
-)
-            )
+            publish_index(*_load_version(version_dir))
             print("Index and chat engine loaded successfully for Issue Resolution.")
         except Exception as e:
             print(f"Failed to load index for Issue Resolution: {e}")
-            index = None
-            chat_engine = None
+            publish_index(None)
     else:
         print("No existing local index found for Issue Resolution. Please run build_index() first.")
-        index = None
-        chat_engine = None
+        publish_index(None)
 
 
-def get_issue_chat_engine():
-    global chat_engine
-    return chat_engine
+def get_index_versions():
+    return describe_versions(index_storage_dir)
+
+
+def rollback_index(version_id=None):
+    """
+    Publishes version_id, or the version before the current one, and serves it.
+    Returns the published version id, or None if there is no such version.
+    """
+    target = get_rollback_target(index_storage_dir, version_id)
+    if target is None:
+        return None
+    # Loaded before CURRENT moves, so a version that cannot be loaded is never published
+    loaded = _load_version(get_version_dir(index_storage_dir, target))
+    publish_version(index_storage_dir, target)
+    publish_index(*loaded)
+    print(f"Issue Resolution index rolled back to version {target}.")
+    return target
+
+
+def get_issue_chat_memory(thread_id=None):
+    """In "thread" mode each thread_id gets its own chat memory; otherwise every call starts empty."""
+    if ISSUE_CHAT_MODE == "stateless" or thread_id is None:
+        return ChatMemoryBuffer.from_defaults(token_limit=ISSUE_CHAT_MEMORY_TOKEN_LIMIT)
+    return _get_thread_memory(thread_id)
+
+
+def get_issue_chat_engine(thread_id=None, memory=None, nodes=None):
+    """
+    Returns a chat engine for the given conversation, or None if there is no index.
+    Every engine shares the same retriever and uses memory, or the conversation's chat memory.
+    Pass nodes to answer from nodes that were already retrieved instead.
+    """
+    current_retriever = retriever
+    if current_retriever is None:
+        return None
+    if nodes is not None:
+        current_retriever = StaticRetriever(nodes)
+
+    if memory is None:
+        memory = get_issue_chat_memory(thread_id)
+
+    return ContextChatEngine.from_defaults(
+        retriever=current_retriever,
+        memory=memory,
+        system_prompt=ISSUE_RESOLUTION_SYSTEM_PROMPT
+    )
+
+
+def _record_match(path, score):
+    with _match_stats_lock:
+        _match_stats[path] += 1
+        if score is not None:
+            bucket = f"{min(int(score * 20), 20) / 20:.2f}"
+            _match_score_buckets[bucket] = _match_score_buckets.get(bucket, 0) + 1
+
+
+def get_issue_match_stats():
+    with _match_stats_lock:
+        return {
+            "direct_return_threshold": ISSUE_DIRECT_RETURN_THRESHOLD,
+            "no_match_floor": ISSUE_NO_MATCH_FLOOR,
+            **_match_stats,
+            "top_score_histogram": dict(sorted(_match_score_buckets.items()))
+        }
+
+
+def _remember_turn(memory, query, answer):
+    # Keep the conversation's memory complete for later turns that do reach the LLM
+    memory.put(ChatMessage(role=MessageRole.USER, content=query))
+    memory.put(ChatMessage(role=MessageRole.ASSISTANT, content=answer))
+
+
+def match_issue_resolution(query, thread_id=None):
+    """
+    Answers an issue query. Returns (answer, path), or None if there is no index.
+
+    The query is retrieved once. The best vector match decides the path: at or above
+    ISSUE_DIRECT_RETURN_THRESHOLD its stored resolution is returned as is ("direct"); below
+    ISSUE_NO_MATCH_FLOOR, and without any BM25 hit (e.g. an exact error code), the answer is
+    NO_RESOLUTION_FOUND ("no_match"); everything else goes through the LLM chat engine with the
+    retrieved nodes ("llm"). Only "llm" answers depend on the conversation.
+    """
+    current_retriever = retriever
+    if current_retriever is None:
+        return None
+
+    query_bundle = QueryBundle(query)
+    if isinstance(current_retriever, HybridRetriever):
+        nodes, dense_results, sparse_results = current_retriever.retrieve_with_rankings(query_bundle)
+    else:
+        nodes = dense_results = current_retriever.retrieve(query_bundle)
+        sparse_results = []
+    score = dense_results[0].score if dense_results else None
+    memory = get_issue_chat_memory(thread_id)
+
+    if score is not None and score >= ISSUE_DIRECT_RETURN_THRESHOLD:
+        answer = get_node_resolution(dense_results[0].node)
+        path = "direct"
+    elif (score is None or score < ISSUE_NO_MATCH_FLOOR) and not sparse_results:
+        answer = NO_RESOLUTION_FOUND
+        path = "no_match"
+    else:
+        _record_match("llm", score)
+        return get_issue_chat_engine(thread_id, memory, nodes).chat(query).response, "llm"
+
+    _record_match(path, score)
+    _remember_turn(memory, query, answer)
+    return answer, path
+
+
+def record_cached_issue_answer(query, answer, thread_id=None):
+    """Books an answer served from the answer cache: counted as "cached" and added to the conversation's memory."""
+    _record_match("cached", None)
+    _remember_turn(get_issue_chat_memory(thread_id), query, answer)
 
 
 def delete_blob_from_azure(blob_name, container_client):
@@ -243,4 +564,4 @@ def delete_blob_from_azure(blob_name, container_client):
         return True
     except Exception as e:
         print(f"Error deleting blob: {e}")
-        return False
\ No newline at end of file
+        return False
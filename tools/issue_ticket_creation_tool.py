@@ -1,50 +1,20 @@
-import os
-import requests
-from dotenv import load_dotenv
+from utils.zoho_utils import get_zoho_config, zoho_desk_request, azoho_desk_request
 
-from utils.zoho_utils import get_zoho_access_token
 
-def create_zoho_ticket(subject: str, email: str):
-    load_dotenv()
-
-    department_id = os.getenv("ZOHO_DEPARTMENT_ID")
-    contact_id = os.getenv("ZOHO_CONTACT_ID")
-    org_id = os.getenv("ZOHO_ORG_ID")
-
-    if not all([department_id, contact_id, org_id]):
+def _ticket_payload(subject, email):
+    config = get_zoho_config()
+    if not all([config.department_id, config.contact_id, config.org_id]):
         raise ValueError("Missing env variables")
 
-    url = "https://desk.zoho.in/api/v1/tickets"
-
-    def make_request(token):
-        headers = {
-            "Authorization": f"Zoho-oauthtoken {token}",
-            "orgId": org_id,
-            "Content-Type": "application/json"
-        }
-
-        payload = {
-            "subject": subject,
-            "departmentId": department_id,
-            "contactId": contact_id,
-            "email": email
-        }
-
-        return requests.post(url, headers=headers, json=payload)
-
-    # First attempt
-    token = get_zoho_access_token()
-    response = make_request(token)
-
-    # If unauthorized, refresh token and retry once
-    if response.status_code == 401 and "INVALID_OAUTH" in response.text:
-        print("Token Invalid... Creating New!!")
-        token = get_zoho_access_token(force_refresh=True)
-        response = make_request(token)
+    return {
+        "subject": subject,
+        "departmentId": config.department_id,
+        "contactId": config.contact_id,
+        "email": email
+    }
 
-    response.raise_for_status()
 
-    ticket_data = response.json()
+def _ticket_created_message(ticket_data, email):
     ticket_id = ticket_data.get("id")
     # ticket_number = ticket_data.get("ticketNumber")
 
@@ -53,4 +23,16 @@ def create_zoho_ticket(subject: str, email: str):
     }
 
 
-# print(create_zoho_ticket(subject="Test Subject token"))
\ No newline at end of file
+def create_zoho_ticket(subject: str, email: str):
+    response = zoho_desk_request("POST", "/api/v1/tickets", json=_ticket_payload(subject, email))
+    response.raise_for_status()
+    return _ticket_created_message(response.json(), email)
+
+
+async def acreate_zoho_ticket(subject: str, email: str):
+    response = await azoho_desk_request("POST", "/api/v1/tickets", json=_ticket_payload(subject, email))
+    response.raise_for_status()
+    return _ticket_created_message(response.json(), email)
+
+
+# print(create_zoho_ticket(subject="Test Subject token"))
@@ -1,56 +1,18 @@
-import os
-import requests
+from urllib.parse import quote
+from utils.zoho_utils import get_zoho_config, zoho_desk_request, azoho_desk_request
 
-from utils.zoho_utils import get_zoho_access_token
+TICKET_INCLUDE = "contacts,products,assignee,departments,team"
 
-def get_ticket_status(ticket_id: str, email: str) -> str:
-    """
-    Fetches the status of a Zoho Desk ticket using its ID and validates the email.
 
-    Args:
-        ticket_id (str): The Zoho Desk ticket ID.
-        email (str): Email ID to validate against the ticket.
-
-    Returns:
-        str: Ticket status message or an error message if the email doesn't match.
-
-    Raises:
-        ValueError: If required environment variable is missing.
-        HTTPError: If the API request fails.
-    """
-    org_id = os.getenv("ZOHO_ORG_ID")
-
-    if not org_id:
+def _ticket_path(ticket_id):
+    if not get_zoho_config().org_id:
         raise ValueError("Missing required environment variable: ZOHO_ORG_ID")
+    return f"/api/v1/tickets/{quote(str(ticket_id).strip(), safe='')}"
 
-    url = f"https://desk.zoho.in/api/v1/tickets/{ticket_id}?include=contacts,products,assignee,departments,team"
-
-    def make_request(token):
-        headers = {
-            "Authorization": f"Zoho-oauthtoken {token}",
-            "orgId": org_id,
-            "Content-Type": "application/json"
-        }
-        return requests.get(url, headers=headers)
-
-    # First attempt
-    token = get_zoho_access_token()
-    response = make_request(token)
-
-    # Retry once if token is invalid
-    if response.status_code == 401 and "INVALID_OAUTH" in response.text:
-        print("Token Invalid... Creating New!!")
-        token = get_zoho_access_token(force_refresh=True)
-        response = make_request(token)
-
-    response.raise_for_status()
-
-    data = response.json()
 
+def _ticket_status_message(data, email):
     # Compare provided email with email from the response
-    ticket_email = data.get("email", "").strip().lower()
-    # print("Email in the request: "+email)
-    # print("Email in the response: "+ticket_email)
+    ticket_email = (data.get("email") or "").strip().lower()
 
     if email.strip().lower() != ticket_email:
         return (
@@ -65,3 +27,30 @@ def get_ticket_status(ticket_id: str, email: str) -> str:
     return (
         f"The current status of your ticket regarding '{subject}' is: **{status_type}**."
     )
+
+
+def get_ticket_status(ticket_id: str, email: str) -> str:
+    """
+    Fetches the status of a Zoho Desk ticket using its ID and validates the email.
+
+    Args:
+        ticket_id (str): The Zoho Desk ticket ID.
+        email (str): Email ID to validate against the ticket.
+
+    Returns:
+        str: Ticket status message or an error message if the email doesn't match.
+
+    Raises:
+        ValueError: If required environment variable is missing.
+        HTTPError: If the API request fails.
+    """
+    response = zoho_desk_request("GET", _ticket_path(ticket_id), params={"include": TICKET_INCLUDE})
+    response.raise_for_status()
+    return _ticket_status_message(response.json(), email)
+
+
+async def aget_ticket_status(ticket_id: str, email: str) -> str:
+    """Async get_ticket_status, on the shared httpx client."""
+    response = await azoho_desk_request("GET", _ticket_path(ticket_id), params={"include": TICKET_INCLUDE})
+    response.raise_for_status()
+    return _ticket_status_message(response.json(), email)
@@ -0,0 +1,65 @@
+import os
+import numpy as np
+
+
+def ann_settings_from_env(prefix):
+    """
+    Reads the ANN settings of one tool, e.g. ISSUE_ANN_BACKEND / ISSUE_ANN_EF_SEARCH for prefix "ISSUE",
+    as keyword arguments for MmapVectorStore.
+    """
+    return {
+        "ann_backend": os.getenv(f"{prefix}_ANN_BACKEND", "none"),
+        # Graph degree and build-time candidate list: higher means better recall, slower builds, more memory
+        "ann_m": int(os.getenv(f"{prefix}_ANN_M", "16")),
+        "ann_ef_construction": int(os.getenv(f"{prefix}_ANN_EF_CONSTRUCTION", "200")),
+        # Query-time candidate list: the recall/latency knob
+        "ann_ef_search": int(os.getenv(f"{prefix}_ANN_EF_SEARCH", "128")),
+    }
+
+
+class HnswIndex:
+    """
+    HNSW graph over the rows of a unit-vector matrix (hnswlib, inner product space), labelled by row number.
+    hnswlib is only imported when an HNSW index is built or loaded.
+    """
+
+    def __init__(self, index, ef_search):
+        self.index = index
+        self.ef_search = ef_search
+        self.index.set_ef(ef_search)
+
+    def __len__(self):
+        return self.index.get_current_count()
+
+    @classmethod
+    def build(cls, vectors, m=16, ef_construction=200, ef_search=64):
+        import hnswlib
+
+        index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+        index.init_index(max_elements=max(len(vectors), 1), M=m, ef_construction=ef_construction)
+        if len(vectors):
+            index.add_items(vectors, np.arange(len(vectors)))
+        return cls(index, ef_search)
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        self.index.save_index(tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, dim, ef_search=64):
+        import hnswlib
+
+        index = hnswlib.Index(space="ip", dim=dim)
+        index.load_index(path)
+        return cls(index, ef_search)
+
+    def search(self, query_vector, k):
+        """Returns (rows, cosine similarities) of the approximate k nearest rows, best first."""
+        k = min(k, len(self))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        # ef below k makes hnswlib fail; callers hold the store lock, so changing it here is safe
+        self.index.set_ef(max(self.ef_search, k))
+        labels, distances = self.index.knn_query(query_vector, k=k)
+        return labels[0].astype(np.int64), 1.0 - distances[0]
@@ -0,0 +1,116 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+# Cosine similarity above which a cached answer is reused for a differently worded question
+ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+class SemanticAnswerCache:
+    """
+    LRU cache of answers for one index, keyed by query embedding.
+
+    A lookup is a hit when a stored query is identical after normalization, or its embedding
+    is at least `threshold` cosine-similar. Entries belong to an index version and the whole
+    cache is dropped as soon as a lookup or store sees a different version.
+    """
+
+    def __init__(self, name, embed_fn, threshold=ANSWER_CACHE_SIMILARITY_THRESHOLD, max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.name = name
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.enabled = ANSWER_CACHE_ENABLED
+        self.version = None
+        self._lock = threading.Lock()
+        # normalized query -> (unit embedding, answer), least recently used first
+        self._entries = OrderedDict()
+        # Stacked embeddings of _entries, rebuilt lazily after a change
+        self._matrix = None
+        self._matrix_keys = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _sync_version(self, version):
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._matrix = None
+            self.version = version
+
+    def lookup(self, query, version):
+        """Returns (answer or None, query embedding or None). Pass the embedding on to store()."""
+        if not self.enabled:
+            return None, None
+
+        key = normalize_query(query)
+        with self._lock:
+            self._sync_version(version)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][1], self._entries[key][0]
+
+        embedding = np.asarray(self.embed_fn(query), dtype=np.float32)
+        embedding /= (np.linalg.norm(embedding) or 1.0)
+
+        with self._lock:
+            self._sync_version(version)
+            if self._entries:
+                if self._matrix is None:
+                    self._matrix_keys = list(self._entries.keys())
+                    self._matrix = np.stack([self._entries[k][0] for k in self._matrix_keys])
+                similarities = self._matrix @ embedding
+                best = int(np.argmax(similarities))
+                best_key = self._matrix_keys[best]
+                if similarities[best] >= self.threshold and best_key in self._entries:
+                    self._entries.move_to_end(best_key)
+                    self.hits += 1
+                    return self._entries[best_key][1], embedding
+            self.misses += 1
+            return None, embedding
+
+    def store(self, query, embedding, answer, version):
+        if not self.enabled or embedding is None:
+            return
+
+        key = normalize_query(query)
+        with self._lock:
+            self._sync_version(version)
+            self._entries[key] = (embedding, answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "index_version": self.version,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
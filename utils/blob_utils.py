@@ -0,0 +1,125 @@
+import io
+import os
+import queue
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Blobs downloaded and parsed at the same time; peak memory grows with this, not with container size
+BLOB_DOWNLOAD_CONCURRENCY = int(os.getenv("BLOB_DOWNLOAD_CONCURRENCY", "8"))
+
+
+class BlobChunkReader(io.RawIOBase):
+    """Read-only file object over the chunks of a blob download, so a parser can consume it as it arrives."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def open_blob_stream(container_client, blob_name):
+    """Streams a blob chunk by chunk instead of reading it whole with readall()."""
+    downloader = container_client.get_blob_client(blob_name).download_blob()
+    return io.BufferedReader(BlobChunkReader(downloader.chunks()))
+
+
+def download_blob_to_buffer(container_client, blob_name):
+    """Downloads a blob into a seekable buffer, for formats such as .docx (zip) that cannot be parsed as a stream."""
+    buffer = io.BytesIO()
+    container_client.get_blob_client(blob_name).download_blob().readinto(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def iter_blob_results(container_client, blob_names, handler, max_workers=BLOB_DOWNLOAD_CONCURRENCY):
+    """
+    Runs handler(container_client, blob_name) for every blob on a bounded thread pool and yields
+    (blob_name, result) as each one finishes.
+
+    A new blob is only started once a finished one has been handed to the caller, so at most
+    max_workers results exist at a time and the caller's work on one blob (e.g. embedding)
+    overlaps with the downloads of the next ones.
+    """
+    blob_names = iter(blob_names)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="blob-download") as executor:
+        pending = {}
+        for blob_name in blob_names:
+            pending[executor.submit(handler, container_client, blob_name)] = blob_name
+            if len(pending) >= max_workers:
+                break
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                blob_name = pending.pop(future)
+                yield blob_name, future.result()
+
+                next_blob_name = next(blob_names, None)
+                if next_blob_name is not None:
+                    pending[executor.submit(handler, container_client, next_blob_name)] = next_blob_name
+
+
+def iter_blob_chunks(container_client, blob_names, chunk_handler, max_workers=BLOB_DOWNLOAD_CONCURRENCY):
+    """
+    Runs chunk_handler(container_client, blob_name), a generator, for every blob on a bounded thread pool and
+    yields its output as it is produced: ("chunk", blob_name, chunk) for every chunk, then ("done", blob_name, None),
+    or ("error", blob_name, exception) if the handler raised.
+
+    Workers hand over chunks through a queue of max_workers entries and wait while it is full, so at most
+    about twice max_workers chunks exist at a time however large the blobs are.
+    """
+    blob_names = iter(blob_names)
+    results = queue.Queue(maxsize=max_workers)
+    stop = threading.Event()
+
+    def put(item):
+        # Gives up once the caller stopped consuming, so no worker blocks forever on a full queue
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(blob_name):
+        try:
+            for chunk in chunk_handler(container_client, blob_name):
+                if not put(("chunk", blob_name, chunk)):
+                    return
+            put(("done", blob_name, None))
+        except Exception as e:
+            put(("error", blob_name, e))
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="blob-download") as executor:
+        try:
+            running = 0
+            for blob_name in islice(blob_names, max_workers):
+                executor.submit(run, blob_name)
+                running += 1
+
+            while running:
+                kind, blob_name, value = results.get()
+                if kind != "chunk":
+                    running -= 1
+                    next_blob_name = next(blob_names, None)
+                    if next_blob_name is not None:
+                        executor.submit(run, next_blob_name)
+                        running += 1
+                yield kind, blob_name, value
+        finally:
+            stop.set()
@@ -0,0 +1,432 @@
+import os
+import time
+import queue
+import sqlite3
+import asyncio
+import argparse
+import threading
+from contextlib import contextmanager
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+# "sqlite" (default), "postgres", or "memory" (in-process, nothing persisted; for local runs and tests)
+CHECKPOINTER_BACKEND = os.getenv("CHECKPOINTER_BACKEND", "sqlite")
+
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+# WAL lets readers and a writer work in parallel. It needs shared memory, so set this to
+# DELETE if the database sits on a network share that does not support it.
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# How long a request waits for a free pooled connection before failing
+SQLITE_POOL_TIMEOUT_SECONDS = float(os.getenv("SQLITE_POOL_TIMEOUT_SECONDS", "30"))
+
+# Retention (sqlite backend): checkpoints kept per thread, idle time after which a thread is deleted
+# (0 keeps threads forever), how often retention runs and how many free pages each run gives back
+CHECKPOINT_KEEP_LATEST = int(os.getenv("CHECKPOINT_KEEP_LATEST", "10"))
+CHECKPOINT_THREAD_TTL_SECONDS = int(os.getenv("CHECKPOINT_THREAD_TTL_SECONDS", str(7 * 24 * 3600)))
+CHECKPOINT_RETENTION_INTERVAL_SECONDS = int(os.getenv("CHECKPOINT_RETENTION_INTERVAL_SECONDS", "3600"))
+CHECKPOINT_VACUUM_PAGES = int(os.getenv("CHECKPOINT_VACUUM_PAGES", "2000"))
+
+POSTGRES_CHECKPOINT_URI = os.getenv("POSTGRES_CHECKPOINT_URI")
+POSTGRES_POOL_SIZE = int(os.getenv("POSTGRES_POOL_SIZE", "10"))
+
+
+def get_checkpoint_db_path():
+    # Define path depending on environment
+    if os.getenv("CHECKPOINT_DB_PATH"):
+        return os.getenv("CHECKPOINT_DB_PATH")
+    if os.getenv("WEBSITE_SITE_NAME"):
+        # Running on Azure Web App
+        return "/home/chat_memory.db"
+    # Running locally
+    return "chat_memory.db"
+
+
+class ThreadedAsyncSaverMixin:
+    """
+    Async checkpoint API for savers that only implement the sync one.
+    Each call runs the sync method on a worker thread for the duration of the
+    database call only, so the event loop never blocks on the database.
+    """
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        checkpoints = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for checkpoint in checkpoints:
+            yield checkpoint
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    async def aget_delta_channel_history(self, *, config, channels):
+        return await asyncio.to_thread(
+            lambda: self.get_delta_channel_history(config=config, channels=channels)
+        )
+
+
+class PooledSqliteSaver(ThreadedAsyncSaverMixin, SqliteSaver):
+    """
+    SqliteSaver backed by a pool of connections instead of one connection behind a lock,
+    so checkpoints of different threads are read and written in parallel.
+    """
+
+    def __init__(
+        self,
+        db_path,
+        pool_size=SQLITE_POOL_SIZE,
+        journal_mode=SQLITE_JOURNAL_MODE,
+        busy_timeout_ms=SQLITE_BUSY_TIMEOUT_MS,
+        serde=None
+    ):
+        self.db_path = db_path
+        self.journal_mode = journal_mode
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._pool = queue.LifoQueue()
+        # Threads written since the last retention run; None means "all threads" for the first run
+        self._touched_threads = None
+        self._touched_lock = threading.Lock()
+        self.last_retention = None
+        # Used for setup() and anything outside a pooled cursor
+        super().__init__(self._connect(), serde=serde)
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            timeout=self.busy_timeout_ms / 1000
+        )
+        # Only takes effect on a new, empty database and must come before the journal mode switch;
+        # existing databases keep their mode until convert_to_incremental_vacuum() is run
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+        return conn
+
+    @property
+    def conn(self):
+        # SqliteSaver methods use self.conn inside self.cursor(); hand them this thread's pooled connection
+        checked_out = getattr(self._local, "conns", None)
+        if checked_out:
+            return checked_out[-1]
+        return self._setup_conn
+
+    @conn.setter
+    def conn(self, value):
+        self._setup_conn = value
+
+    def setup(self):
+        if self.is_setup:
+            return
+        SqliteSaver.setup(self)
+        # SqliteSaver's setup() switches to WAL unconditionally
+        self._setup_conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        self._setup_conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS thread_activity (
+                thread_id TEXT PRIMARY KEY,
+                last_seen REAL NOT NULL
+            )
+            """
+        )
+        self._setup_conn.commit()
+
+    @contextmanager
+    def cursor(self, transaction=True):
+        if not self.is_setup:
+            with self.lock:
+                self.setup()
+
+        try:
+            conn = self._pool.get(timeout=SQLITE_POOL_TIMEOUT_SECONDS)
+        except queue.Empty:
+            raise RuntimeError(f"No free SQLite connection after {SQLITE_POOL_TIMEOUT_SECONDS}s")
+
+        if not hasattr(self._local, "conns"):
+            self._local.conns = []
+        self._local.conns.append(conn)
+        try:
+            cur = conn.cursor()
+            try:
+                yield cur
+            finally:
+                if transaction:
+                    conn.commit()
+                cur.close()
+        finally:
+            self._local.conns.pop()
+            self._pool.put(conn)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = str(config["configurable"]["thread_id"])
+        with self.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO thread_activity (thread_id, last_seen) VALUES (?, ?)
+                ON CONFLICT(thread_id) DO UPDATE SET last_seen = excluded.last_seen
+                """,
+                (thread_id, time.time())
+            )
+        with self._touched_lock:
+            if self._touched_threads is not None:
+                self._touched_threads.add(thread_id)
+        return next_config
+
+    def delete_thread(self, thread_id):
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM thread_activity WHERE thread_id = ?", (str(thread_id),))
+
+    def apply_retention(
+        self,
+        keep_latest=CHECKPOINT_KEEP_LATEST,
+        thread_ttl_seconds=CHECKPOINT_THREAD_TTL_SECONDS,
+        vacuum_pages=CHECKPOINT_VACUUM_PAGES
+    ):
+        """
+        Deletes idle threads, keeps only the latest checkpoints of recently written threads
+        and gives free pages back to the file system.
+
+        Dropping older checkpoints is safe for this graph because its channels store full values;
+        a graph using DeltaChannel would need the ancestor chain kept.
+        """
+        started = time.time()
+        with self._touched_lock:
+            touched = self._touched_threads
+            self._touched_threads = set()
+
+        with self.cursor() as cur:
+            if touched is None:
+                # First run: threads written before activity was tracked count as active now
+                cur.execute(
+                    "INSERT OR IGNORE INTO thread_activity (thread_id, last_seen) "
+                    "SELECT DISTINCT thread_id, ? FROM checkpoints",
+                    (started,)
+                )
+
+            expired_threads = []
+            if thread_ttl_seconds > 0:
+                cur.execute(
+                    "SELECT thread_id FROM thread_activity WHERE last_seen < ?",
+                    (started - thread_ttl_seconds,)
+                )
+                expired_threads = [row[0] for row in cur.fetchall()]
+                for thread_id in expired_threads:
+                    cur.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+                    cur.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+                    cur.execute("DELETE FROM thread_activity WHERE thread_id = ?", (thread_id,))
+
+            cur.execute("CREATE TEMP TABLE IF NOT EXISTS retention_threads (thread_id TEXT PRIMARY KEY)")
+            cur.execute("DELETE FROM retention_threads")
+            if touched is None:
+                cur.execute("INSERT INTO retention_threads SELECT thread_id FROM thread_activity")
+            else:
+                cur.executemany(
+                    "INSERT OR IGNORE INTO retention_threads (thread_id) VALUES (?)",
+                    [(thread_id,) for thread_id in touched]
+                )
+
+            cur.execute(
+                """
+                DELETE FROM checkpoints WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (
+                            PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+                        ) AS rn
+                        FROM checkpoints
+                        WHERE thread_id IN (SELECT thread_id FROM retention_threads)
+                    ) WHERE rn > ?
+                )
+                """,
+                (keep_latest,)
+            )
+            deleted_checkpoints = cur.rowcount
+            cur.execute(
+                """
+                DELETE FROM writes
+                WHERE thread_id IN (SELECT thread_id FROM retention_threads)
+                AND NOT EXISTS (
+                    SELECT 1 FROM checkpoints c
+                    WHERE c.thread_id = writes.thread_id
+                    AND c.checkpoint_ns = writes.checkpoint_ns
+                    AND c.checkpoint_id = writes.checkpoint_id
+                )
+                """
+            )
+            deleted_writes = cur.rowcount
+
+        self.compact(vacuum_pages)
+
+        self.last_retention = {
+            "finished_at": time.time(),
+            "duration_seconds": round(time.time() - started, 3),
+            "expired_threads": len(expired_threads),
+            "deleted_checkpoints": deleted_checkpoints,
+            "deleted_writes": deleted_writes
+        }
+        print(f"Checkpoint retention: {self.last_retention}")
+        return self.last_retention
+
+    def auto_vacuum_mode(self):
+        with self.lock:
+            mode = self._setup_conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        return {0: "none", 1: "full", 2: "incremental"}.get(mode, str(mode))
+
+    def compact(self, vacuum_pages=CHECKPOINT_VACUUM_PAGES):
+        """
+        Releases up to vacuum_pages free pages and truncates the WAL.
+        Free pages are only released on databases in incremental auto-vacuum mode.
+        """
+        with self.lock:
+            conn = self._setup_conn
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                conn.execute(f"PRAGMA incremental_vacuum({int(vacuum_pages)})").fetchall()
+            if self.journal_mode.upper() == "WAL":
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+    def convert_to_incremental_vacuum(self):
+        """
+        Switches an existing database to incremental auto-vacuum. This rewrites the whole file
+        with a full VACUUM, so run it once while the app is stopped (see main() below).
+        """
+        with self.lock:
+            conn = self._setup_conn
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                print("Checkpoint database already uses incremental auto-vacuum")
+                return False
+            print("Converting checkpoint database to incremental auto-vacuum...")
+            started = time.time()
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+            print(f"Converted in {time.time() - started:.1f}s")
+            return True
+
+    def get_stats(self):
+        with self.cursor(transaction=False) as cur:
+            threads = cur.execute("SELECT COUNT(*) FROM thread_activity").fetchone()[0]
+            checkpoints = cur.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+            writes = cur.execute("SELECT COUNT(*) FROM writes").fetchone()[0]
+            page_size = cur.execute("PRAGMA page_size").fetchone()[0]
+            page_count = cur.execute("PRAGMA page_count").fetchone()[0]
+            freelist_count = cur.execute("PRAGMA freelist_count").fetchone()[0]
+
+        wal_path = self.db_path + "-wal"
+        return {
+            "backend": "sqlite",
+            "db_path": self.db_path,
+            "threads": threads,
+            "checkpoints": checkpoints,
+            "writes": writes,
+            "bytes": page_size * page_count,
+            "free_bytes": page_size * freelist_count,
+            "wal_bytes": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+            "auto_vacuum": self.auto_vacuum_mode(),
+            "last_retention": self.last_retention
+        }
+
+
+def create_postgres_saver(conn_string=None, pool_size=POSTGRES_POOL_SIZE):
+    from psycopg.rows import dict_row
+    from psycopg_pool import ConnectionPool
+    from langgraph.checkpoint.postgres import PostgresSaver
+
+    class PooledPostgresSaver(ThreadedAsyncSaverMixin, PostgresSaver):
+        pass
+
+    conn_string = conn_string or POSTGRES_CHECKPOINT_URI
+    if not conn_string:
+        raise ValueError("Missing required environment variable: POSTGRES_CHECKPOINT_URI")
+
+    pool = ConnectionPool(
+        conninfo=conn_string,
+        max_size=pool_size,
+        kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+        open=True
+    )
+    saver = PooledPostgresSaver(pool)
+    saver.setup()
+    return saver
+
+
+def create_checkpointer(backend=None):
+    """Creates the checkpointer selected by CHECKPOINTER_BACKEND. Every backend supports sync and async use."""
+    backend = backend or CHECKPOINTER_BACKEND
+
+    if backend == "sqlite":
+        db_path = get_checkpoint_db_path()
+        print(f"DB Path = {db_path}")
+        return PooledSqliteSaver(db_path)
+
+    if backend == "postgres":
+        print("Using Postgres checkpointer")
+        return create_postgres_saver()
+
+    if backend == "memory":
+        from langgraph.checkpoint.memory import InMemorySaver
+        print("Using in-memory checkpointer, conversations are not persisted")
+        return InMemorySaver()
+
+    raise ValueError(f"Unknown CHECKPOINTER_BACKEND '{backend}'. Use sqlite, postgres or memory.")
+
+
+def get_checkpoint_stats(saver):
+    if hasattr(saver, "get_stats"):
+        return saver.get_stats()
+    return {"backend": type(saver).__name__, "message": "Stats are only collected for the sqlite backend."}
+
+
+def start_checkpoint_retention(saver, interval_seconds=CHECKPOINT_RETENTION_INTERVAL_SECONDS):
+    """
+    Runs apply_retention() on a daemon thread every interval_seconds, starting one interval after
+    startup so workers do not all run it while they boot. No-op for backends without retention.
+    """
+    if not hasattr(saver, "apply_retention") or interval_seconds <= 0:
+        return None
+
+    def run():
+        while True:
+            time.sleep(interval_seconds)
+            try:
+                saver.apply_retention()
+            except Exception as e:
+                print(f"Checkpoint retention failed: {e}")
+
+    thread = threading.Thread(target=run, name="checkpoint-retention", daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance of the sqlite checkpoint database")
+    parser.add_argument(
+        "command",
+        choices=["convert-auto-vacuum", "retention"],
+        help="convert-auto-vacuum: one-off switch to incremental auto-vacuum (stop the app first); "
+             "retention: run one retention pass now"
+    )
+    parser.add_argument("--db-path", default=None, help="Defaults to CHECKPOINT_DB_PATH or the app's default path")
+    args = parser.parse_args()
+
+    saver = PooledSqliteSaver(args.db_path or get_checkpoint_db_path(), pool_size=1)
+    saver.setup()
+    if args.command == "convert-auto-vacuum":
+        saver.convert_to_incremental_vacuum()
+    else:
+        saver.apply_retention()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, List
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "1000000"))
+# Same default as the checkpoint database; set DELETE if the cache sits on a network share without shared memory
+EMBEDDING_CACHE_JOURNAL_MODE = os.getenv("EMBEDDING_CACHE_JOURNAL_MODE", os.getenv("SQLITE_JOURNAL_MODE", "WAL"))
+# Query embeddings are only kept in memory (per process), so they never evict document embeddings
+# and the request path never writes to the cache file
+EMBEDDING_QUERY_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_QUERY_CACHE_MAX_ENTRIES", "10000"))
+# Cache hits are remembered in memory and their last_used written in one statement on the next insert,
+# or once this many have piled up
+LAST_USED_FLUSH_SIZE = 1000
+# SQLite limits the number of parameters per statement
+LOOKUP_CHUNK_SIZE = 500
+
+
+def get_embedding_cache_path():
+    if os.getenv("EMBEDDING_CACHE_PATH"):
+        return os.getenv("EMBEDDING_CACHE_PATH")
+    if os.getenv("WEBSITE_SITE_NAME"):
+        # Running on Azure Web App, /home survives restarts and redeploys
+        return "/home/embedding_cache.db"
+    return "embedding_cache.db"
+
+
+def embedding_cache_key(model_name, kind, text):
+    return hashlib.sha256(f"{model_name}\x00{kind}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """On-disk map of cache key -> float32 vector, trimmed to max_entries by least recent use."""
+
+    def __init__(self, path, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # Same setting as the checkpoint database: DELETE where the file sits on a share without shared memory
+        self._conn.execute(f"PRAGMA journal_mode={EMBEDDING_CACHE_JOURNAL_MODE}")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        # Keys hit since last_used was last written
+        self._touched = set()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys):
+        """Returns {key: vector} for the keys that are cached."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+                chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+            self._touched.update(found)
+            if len(self._touched) >= LAST_USED_FLUSH_SIZE:
+                self._flush_last_used(time.time())
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def _flush_last_used(self, now):
+        """Writes last_used of the keys hit since the last flush. Call with the lock held; the caller commits."""
+        touched = list(self._touched)
+        self._touched.clear()
+        for start in range(0, len(touched), LOOKUP_CHUNK_SIZE):
+            chunk = touched[start:start + LOOKUP_CHUNK_SIZE]
+            self._conn.execute(
+                f"UPDATE embeddings SET last_used = ? WHERE key IN ({','.join('?' * len(chunk))})",
+                [now] + chunk
+            )
+
+    def put_many(self, items):
+        """Stores (key, vector) pairs and trims the store if it grew past max_entries."""
+        now = time.time()
+        with self._lock:
+            # Recent hits must count before the trim below picks the least recently used entries
+            self._flush_last_used(now)
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items]
+            )
+            self._count += self._conn.total_changes - before
+
+            if self._count > self.max_entries:
+                # Trim to 90% so the delete does not run on every insert
+                excess = self._count - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self._conn.commit()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "path": self.path,
+                "entries": self._count,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+class QueryEmbeddingCache:
+    """In-memory LRU of query embeddings; a query is often embedded several times within one request."""
+
+    def __init__(self, max_entries=EMBEDDING_QUERY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, key, embedding):
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+_query_cache = QueryEmbeddingCache()
+
+
+def get_embedding_store(path=None):
+    """One store per file, shared by every CachedEmbedding in the process."""
+    path = path or get_embedding_cache_path()
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = EmbeddingStore(path)
+        return _stores[path]
+
+
+def get_query_embedding_cache():
+    return _query_cache
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Wraps an embed model with a content-addressed cache keyed by (model name, text hash),
+    so text that was embedded once is never sent to the embedding API again.
+    Document text is cached on disk, queries in memory only.
+    """
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _store: EmbeddingStore = PrivateAttr()
+    _query_cache: QueryEmbeddingCache = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, store: EmbeddingStore = None, **kwargs: Any):
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            **kwargs
+        )
+        self._inner = inner
+        self._store = store or get_embedding_store()
+        self._query_cache = get_query_embedding_cache()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        return self._inner
+
+    def _lookup(self, kind, texts):
+        keys = [embedding_cache_key(self.model_name, kind, text) for text in texts]
+        return keys, self._store.get_many(keys)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        key = embedding_cache_key(self.model_name, "query", query)
+        embedding = self._query_cache.get(key)
+        if embedding is None:
+            embedding = self._inner._get_query_embedding(query)
+            self._query_cache.put(key, embedding)
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        key = embedding_cache_key(self.model_name, "query", query)
+        embedding = self._query_cache.get(key)
+        if embedding is None:
+            embedding = await self._inner._aget_query_embedding(query)
+            self._query_cache.put(key, embedding)
+        return embedding
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def lookup_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Cached embedding of each text, None where there is none."""
+        keys, found = self._lookup("text", texts)
+        return [found.get(key) for key in keys]
+
+    def embed_and_cache_texts(self, texts: List[str]) -> List[List[float]]:
+        """Embeds texts with the wrapped model and caches them, without looking them up first."""
+        embeddings = self._inner._get_text_embeddings(texts)
+        self._store.put_many([
+            (embedding_cache_key(self.model_name, "text", text), embedding)
+            for text, embedding in zip(texts, embeddings)
+        ])
+        return embeddings
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, found = self._lookup("text", texts)
+        missing = list({key: text for key, text in zip(keys, texts) if key not in found}.items())
+        if missing:
+            embeddings = self._inner._get_text_embeddings([text for _, text in missing])
+            new_items = [(key, embedding) for (key, _), embedding in zip(missing, embeddings)]
+            self._store.put_many(new_items)
+            found.update(new_items)
+        return [found[key] for key in keys]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, found = self._lookup("text", texts)
+        missing = list({key: text for key, text in zip(keys, texts) if key not in found}.items())
+        if missing:
+            embeddings = await self._inner._aget_text_embeddings([text for _, text in missing])
+            new_items = [(key, embedding) for (key, _), embedding in zip(missing, embeddings)]
+            self._store.put_many(new_items)
+            found.update(new_items)
+        return [found[key] for key in keys]
+
+
+def with_embedding_cache(embed_model):
+    if not EMBEDDING_CACHE_ENABLED:
+        return embed_model
+    return CachedEmbedding(embed_model)
@@ -0,0 +1,192 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from typing import Any, List
+from concurrent.futures import ThreadPoolExecutor
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+EMBEDDING_SCHEDULER_ENABLED = os.getenv("EMBEDDING_SCHEDULER_ENABLED", "true").lower() == "true"
+# Texts per embedding call, and how many calls may run at the same time
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "50"))
+EMBEDDING_MAX_IN_FLIGHT = int(os.getenv("EMBEDDING_MAX_IN_FLIGHT", "4"))
+# Texts sent to the embedding API per minute across all calls (token bucket); 0 disables the limit
+EMBEDDING_RATE_LIMIT_PER_MINUTE = float(os.getenv("EMBEDDING_RATE_LIMIT_PER_MINUTE", "1500"))
+# Retries of a batch that hit a rate limit or a transient server error, with exponential backoff and jitter
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+EMBEDDING_RETRY_BASE_SECONDS = float(os.getenv("EMBEDDING_RETRY_BASE_SECONDS", "2"))
+EMBEDDING_RETRY_MAX_SECONDS = float(os.getenv("EMBEDDING_RETRY_MAX_SECONDS", "60"))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_MESSAGES = ("429", "RESOURCE_EXHAUSTED", "Too Many Requests", "UNAVAILABLE", "rate limit")
+
+
+def is_retryable_error(error):
+    """True for rate limits and transient server errors, whichever Google client raised them."""
+    for attribute in ("code", "status_code"):
+        value = getattr(error, attribute, None)
+        value = value() if callable(value) else value
+        if value in RETRYABLE_STATUS_CODES:
+            return True
+    message = str(error)
+    return any(text.lower() in message.lower() for text in RETRYABLE_MESSAGES)
+
+
+class TokenBucket:
+    """Allows rate_per_minute units per minute on average, in bursts of at most capacity units."""
+
+    def __init__(self, rate_per_minute, capacity):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        if self.rate <= 0:
+            return
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ScheduledEmbedding(BaseEmbedding):
+    """
+    Wraps an embed model so large embedding jobs are split into batches of EMBEDDING_BATCH_SIZE texts,
+    at most EMBEDDING_MAX_IN_FLIGHT batches run concurrently, the texts sent stay under
+    EMBEDDING_RATE_LIMIT_PER_MINUTE, and a batch that hits a 429 is retried with backoff instead of
+    failing the build.
+
+    When the wrapped model is a CachedEmbedding, texts that are already cached skip the queue, and
+    every finished batch is cached at once: an interrupted build resumes where it stopped.
+    """
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _bucket: TokenBucket = PrivateAttr()
+    _in_flight: threading.BoundedSemaphore = PrivateAttr()
+    _stats: dict = PrivateAttr()
+    _stats_lock: Any = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, **kwargs: Any):
+        super().__init__(
+            model_name=inner.model_name,
+            # LlamaIndex hands over this many texts per call; they are batched and parallelized here
+            embed_batch_size=min(EMBEDDING_BATCH_SIZE * EMBEDDING_MAX_IN_FLIGHT * 4, 2048),
+            **kwargs
+        )
+        self._inner = inner
+        self._bucket = TokenBucket(
+            EMBEDDING_RATE_LIMIT_PER_MINUTE, max(EMBEDDING_BATCH_SIZE, EMBEDDING_RATE_LIMIT_PER_MINUTE / 60)
+        )
+        self._in_flight = threading.BoundedSemaphore(EMBEDDING_MAX_IN_FLIGHT)
+        self._stats = {"batches": 0, "texts": 0, "cached_texts": 0, "retries": 0, "failures": 0}
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ScheduledEmbedding"
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        return self._inner
+
+    def _count(self, **fields):
+        with self._stats_lock:
+            for key, value in fields.items():
+                self._stats[key] += value
+
+    def _call(self, call, *args):
+        try:
+            return call(*args), None
+        except Exception as e:
+            if not is_retryable_error(e):
+                self._count(failures=1)
+                raise
+            return None, e
+
+    def _call_with_retry(self, cost, call, *args, scheduled=True):
+        """Calls call(*args), retrying rate limits; scheduled calls also wait for the bucket and an in-flight slot."""
+        for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+            if scheduled:
+                self._bucket.acquire(cost)
+                with self._in_flight:
+                    result, error = self._call(call, *args)
+            else:
+                result, error = self._call(call, *args)
+            if error is None:
+                return result
+            if attempt == EMBEDDING_MAX_RETRIES:
+                self._count(failures=1)
+                raise error
+            delay = min(EMBEDDING_RETRY_MAX_SECONDS, EMBEDDING_RETRY_BASE_SECONDS * 2 ** attempt)
+            delay *= random.uniform(0.5, 1.0)
+            print(f"Embedding call failed ({error}), retry {attempt + 1}/{EMBEDDING_MAX_RETRIES} in {delay:.1f}s")
+            self._count(retries=1)
+            time.sleep(delay)
+
+    def _embed_batch(self, batch):
+        # A CachedEmbedding stores each finished batch right away, which is what makes builds resumable
+        embed = getattr(self._inner, "embed_and_cache_texts", self._inner._get_text_embeddings)
+        embeddings = self._call_with_retry(len(batch), embed, batch)
+        self._count(batches=1, texts=len(batch))
+        return embeddings
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        # User queries never queue behind a running build
+        return self._call_with_retry(1, self._inner._get_query_embedding, query, scheduled=False)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await asyncio.to_thread(self._get_query_embedding, query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        lookup = getattr(self._inner, "lookup_text_embeddings", None)
+        results = lookup(texts) if lookup is not None else [None] * len(texts)
+        # Each distinct text that is not cached yet is embedded once
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, results) if embedding is None))
+        self._count(cached_texts=sum(embedding is not None for embedding in results))
+
+        batches = [missing[start:start + EMBEDDING_BATCH_SIZE] for start in range(0, len(missing), EMBEDDING_BATCH_SIZE)]
+        if len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=EMBEDDING_MAX_IN_FLIGHT, thread_name_prefix="embed") as executor:
+                outputs = list(executor.map(self._embed_batch, batches))
+        else:
+            outputs = [self._embed_batch(batch) for batch in batches]
+
+        embedded = {}
+        for batch, embeddings in zip(batches, outputs):
+            embedded.update(zip(batch, embeddings))
+        return [embedding if embedding is not None else embedded[text] for text, embedding in zip(texts, results)]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self._get_text_embeddings, texts)
+
+    def get_stats(self):
+        with self._stats_lock:
+            return {
+                "batch_size": EMBEDDING_BATCH_SIZE,
+                "max_in_flight": EMBEDDING_MAX_IN_FLIGHT,
+                "rate_limit_per_minute": EMBEDDING_RATE_LIMIT_PER_MINUTE,
+                **self._stats
+            }
+
+
+def with_embedding_scheduler(embed_model):
+    if not EMBEDDING_SCHEDULER_ENABLED:
+        return embed_model
+    return ScheduledEmbedding(embed_model)
@@ -0,0 +1,167 @@
+import os
+import re
+import json
+import math
+import heapq
+import threading
+from collections import Counter
+from typing import List
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+BM25_INDEX_FILENAME = "bm25_index.json"
+
+# Keeps error codes and identifiers such as "E-1023", "ERR_42" or "v2.3" as single tokens
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """In-process inverted index with Okapi BM25 scoring, updated node by node."""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        # node_id -> (document length, {term: term frequency})
+        self._docs = {}
+        # term -> {node_id: term frequency}
+        self._postings = {}
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, node_id, text):
+        term_counts = Counter(tokenize(text))
+        length = sum(term_counts.values())
+        with self._lock:
+            self._remove(node_id)
+            self._docs[node_id] = (length, dict(term_counts))
+            self._total_length += length
+            for term, frequency in term_counts.items():
+                self._postings.setdefault(term, {})[node_id] = frequency
+
+    def remove(self, node_id):
+        with self._lock:
+            self._remove(node_id)
+
+    def _remove(self, node_id):
+        entry = self._docs.pop(node_id, None)
+        if entry is None:
+            return
+        length, term_counts = entry
+        self._total_length -= length
+        for term in term_counts:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(node_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def search(self, query, top_k):
+        """Returns up to top_k (node_id, score) pairs, best first."""
+        with self._lock:
+            doc_count = len(self._docs)
+            if not doc_count:
+                return []
+            average_length = self._total_length / doc_count or 1.0
+            scores = {}
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for node_id, frequency in postings.items():
+                    length = self._docs[node_id][0]
+                    norm = frequency + self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[node_id] = scores.get(node_id, 0.0) + idf * frequency * (self.k1 + 1) / norm
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def persist(self, persist_dir):
+        path = os.path.join(persist_dir, BM25_INDEX_FILENAME)
+        with self._lock:
+            data = {"k1": self.k1, "b": self.b, "docs": self._docs}
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, persist_dir):
+        """Returns the index persisted in persist_dir, or None if there is none."""
+        path = os.path.join(persist_dir, BM25_INDEX_FILENAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        bm25 = cls(k1=data["k1"], b=data["b"])
+        for node_id, (length, term_counts) in data["docs"].items():
+            bm25._docs[node_id] = (length, term_counts)
+            bm25._total_length += length
+            for term, frequency in term_counts.items():
+                bm25._postings.setdefault(term, {})[node_id] = frequency
+        return bm25
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses a vector retriever with a BM25Index through reciprocal-rank fusion:
+    every node scores sum(1 / (rrf_k + rank)) over the rankings it appears in.
+    """
+
+    def __init__(self, vector_retriever, bm25_index, docstore, top_k=2, sparse_top_k=10, rrf_k=60):
+        super().__init__()
+        self.vector_retriever = vector_retriever
+        self.bm25_index = bm25_index
+        self.docstore = docstore
+        self.top_k = top_k
+        self.sparse_top_k = sparse_top_k
+        self.rrf_k = rrf_k
+
+    def _fuse(self, dense_results, sparse_results):
+        nodes = {}
+        scores = {}
+        for rank, result in enumerate(dense_results):
+            node_id = result.node.node_id
+            nodes[node_id] = result.node
+            scores[node_id] = scores.get(node_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+        for rank, (node_id, _) in enumerate(sparse_results):
+            if node_id not in nodes:
+                node = self.docstore.get_node(node_id, raise_error=False)
+                if node is None:
+                    continue
+                nodes[node_id] = node
+            scores[node_id] = scores.get(node_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+        best = heapq.nlargest(self.top_k, scores.items(), key=lambda item: item[1])
+        return [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in best]
+
+    def retrieve_with_rankings(self, query_bundle: QueryBundle):
+        """Returns (fused nodes, vector results, BM25 (node_id, score) pairs), for callers that also need either side."""
+        dense_results = self.vector_retriever.retrieve(query_bundle)
+        sparse_results = self.bm25_index.search(query_bundle.query_str, self.sparse_top_k)
+        return self._fuse(dense_results, sparse_results), dense_results, sparse_results
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self.retrieve_with_rankings(query_bundle)[0]
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        dense_results = await self.vector_retriever.aretrieve(query_bundle)
+        sparse_results = self.bm25_index.search(query_bundle.query_str, self.sparse_top_k)
+        return self._fuse(dense_results, sparse_results)
+
+
+class StaticRetriever(BaseRetriever):
+    """Returns nodes that were already retrieved, so a chat engine does not search a second time."""
+
+    def __init__(self, nodes):
+        super().__init__()
+        self.nodes = nodes
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self.nodes
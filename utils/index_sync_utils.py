@@ -0,0 +1,380 @@
+import os
+import time
+import uuid
+import shutil
+import threading
+from contextlib import contextmanager
+from utils.index_version_utils import (
+    INDEX_KEEP_VERSIONS, COMPLETE_FILENAME, VERSIONS_DIRNAME, get_version_dir, get_current_version,
+    publish_version, unpublish_version, prune_versions
+)
+
+# Where published index versions are shared between workers and instances:
+# "none" (every process keeps its own), "local" (a directory, e.g. a mounted share; also for tests) or "blob"
+INDEX_SYNC_BACKEND = os.getenv("INDEX_SYNC_BACKEND", "none")
+INDEX_SYNC_LOCAL_DIR = os.getenv("INDEX_SYNC_LOCAL_DIR", "index_sync")
+INDEX_SYNC_BLOB_PREFIX = os.getenv("INDEX_SYNC_BLOB_PREFIX", "index_versions/")
+# How often every worker checks for a version published by another one
+INDEX_SYNC_POLL_SECONDS = float(os.getenv("INDEX_SYNC_POLL_SECONDS", "30"))
+# How long a build waits for the builder lock held by another worker
+INDEX_SYNC_LOCK_TIMEOUT_SECONDS = float(os.getenv("INDEX_SYNC_LOCK_TIMEOUT_SECONDS", "3600"))
+# Blob leases last 15-60 seconds and are renewed while the build runs, so a crashed builder frees the lock quickly
+INDEX_SYNC_LEASE_SECONDS = 60
+
+# The shared store mirrors the local layout of utils/index_version_utils.py per index kind:
+#
+#     <shared>/<kind>/CURRENT
+#     <shared>/<kind>/versions/<version_id>/...
+#
+# One builder at a time, chosen by the store's lock, builds on top of the shared CURRENT version,
+# uploads the new version and then moves the shared CURRENT. Every worker polls the shared CURRENT
+# and downloads and hot-reloads a version it is not serving yet.
+
+
+def _install_version(local_root, version_id, fill_fn):
+    """Fills a temporary directory with fill_fn and moves it into place as version_id of local_root."""
+    target = get_version_dir(local_root, version_id)
+    tmp_dir = os.path.join(local_root, VERSIONS_DIRNAME, f".{version_id}.{uuid.uuid4().hex}.tmp")
+    os.makedirs(tmp_dir)
+    try:
+        fill_fn(tmp_dir)
+        if os.path.isdir(target) and not os.path.exists(os.path.join(target, COMPLETE_FILENAME)):
+            # Left over from an interrupted build or download
+            shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp_dir, target)
+    except OSError:
+        # Another worker on this machine installed the same version first
+        if not os.path.exists(os.path.join(target, COMPLETE_FILENAME)):
+            raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _is_version_complete(root, version_id):
+    return os.path.exists(os.path.join(get_version_dir(root, version_id), COMPLETE_FILENAME))
+
+
+class LocalIndexSyncStore:
+    """Shared versions in a directory every process can reach, locked with an exclusive file lock."""
+
+    def __init__(self, root_dir):
+        self.root_dir = os.path.abspath(root_dir)
+
+    def _kind_root(self, kind):
+        return os.path.join(self.root_dir, kind)
+
+    @contextmanager
+    def lock(self, kind, timeout=INDEX_SYNC_LOCK_TIMEOUT_SECONDS):
+        import fcntl
+
+        os.makedirs(self._kind_root(kind), exist_ok=True)
+        with open(os.path.join(self._kind_root(kind), ".lock"), "a") as lock_file:
+            deadline = time.time() + timeout
+            while True:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.time() > deadline:
+                        raise TimeoutError(f"Timed out waiting for the '{kind}' index builder lock")
+                    time.sleep(1)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def get_current_version(self, kind):
+        return get_current_version(self._kind_root(kind))
+
+    def has_version(self, kind, version_id):
+        return _is_version_complete(self._kind_root(kind), version_id)
+
+    def upload_version(self, kind, version_id, local_dir):
+        _install_version(
+            self._kind_root(kind), version_id,
+            lambda tmp_dir: shutil.copytree(local_dir, tmp_dir, dirs_exist_ok=True)
+        )
+
+    def download_version(self, kind, version_id, local_root):
+        shared_dir = get_version_dir(self._kind_root(kind), version_id)
+        _install_version(local_root, version_id, lambda tmp_dir: shutil.copytree(shared_dir, tmp_dir, dirs_exist_ok=True))
+
+    def set_current_version(self, kind, version_id):
+        if version_id is None:
+            unpublish_version(self._kind_root(kind))
+        else:
+            publish_version(self._kind_root(kind), version_id)
+
+    def prune_versions(self, kind, keep=INDEX_KEEP_VERSIONS):
+        prune_versions(self._kind_root(kind), keep)
+
+
+class BlobIndexSyncStore:
+    """Shared versions under a prefix of the Azure blob container, locked with a blob lease."""
+
+    def __init__(self, container_client, prefix=INDEX_SYNC_BLOB_PREFIX):
+        self.container_client = container_client
+        self.prefix = prefix
+
+    def _blob_name(self, kind, *parts):
+        return "/".join([self.prefix.rstrip("/"), kind, *parts])
+
+    def _version_prefix(self, kind, version_id):
+        return self._blob_name(kind, VERSIONS_DIRNAME, version_id) + "/"
+
+    @contextmanager
+    def lock(self, kind, timeout=INDEX_SYNC_LOCK_TIMEOUT_SECONDS):
+        from azure.core.exceptions import HttpResponseError, ResourceExistsError
+
+        lock_blob = self.container_client.get_blob_client(self._blob_name(kind, "LOCK"))
+        try:
+            lock_blob.upload_blob(b"", overwrite=False)
+        except ResourceExistsError:
+            pass
+
+        deadline = time.time() + timeout
+        while True:
+            try:
+                lease = lock_blob.acquire_lease(lease_duration=INDEX_SYNC_LEASE_SECONDS)
+                break
+            except HttpResponseError as e:
+                if e.status_code != 409:
+                    raise
+                if time.time() > deadline:
+                    raise TimeoutError(f"Timed out waiting for the '{kind}' index builder lease")
+                time.sleep(5)
+
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(INDEX_SYNC_LEASE_SECONDS / 3):
+                try:
+                    lease.renew()
+                except Exception as e:
+                    print(f"Failed to renew the '{kind}' index builder lease: {e}")
+
+        renewer = threading.Thread(target=renew, name=f"index-lease-{kind}", daemon=True)
+        renewer.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            renewer.join()
+            try:
+                lease.release()
+            except Exception as e:
+                print(f"Failed to release the '{kind}' index builder lease: {e}")
+
+    def get_current_version(self, kind):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            data = self.container_client.get_blob_client(self._blob_name(kind, "CURRENT")).download_blob().readall()
+        except ResourceNotFoundError:
+            return None
+        return data.decode("utf-8").strip() or None
+
+    def has_version(self, kind, version_id):
+        return self.container_client.get_blob_client(self._version_prefix(kind, version_id) + COMPLETE_FILENAME).exists()
+
+    def upload_version(self, kind, version_id, local_dir):
+        paths = []
+        for dirpath, _, filenames in os.walk(local_dir):
+            for filename in filenames:
+                paths.append(os.path.relpath(os.path.join(dirpath, filename), local_dir))
+        # The completion marker goes last, so a version is never used before all of its files are there
+        paths.sort(key=lambda path: path == COMPLETE_FILENAME)
+        for path in paths:
+            blob_client = self.container_client.get_blob_client(
+                self._version_prefix(kind, version_id) + path.replace(os.sep, "/")
+            )
+            with open(os.path.join(local_dir, path), "rb") as f:
+                blob_client.upload_blob(f, overwrite=True)
+
+    def download_version(self, kind, version_id, local_root):
+        version_prefix = self._version_prefix(kind, version_id)
+
+        def fill(tmp_dir):
+            for blob in self.container_client.list_blobs(name_starts_with=version_prefix):
+                path = os.path.join(tmp_dir, *blob.name[len(version_prefix):].split("/"))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    self.container_client.get_blob_client(blob.name).download_blob().readinto(f)
+            if not os.path.exists(os.path.join(tmp_dir, COMPLETE_FILENAME)):
+                raise FileNotFoundError(f"Index version {version_id} of '{kind}' is incomplete in blob storage")
+
+        _install_version(local_root, version_id, fill)
+
+    def set_current_version(self, kind, version_id):
+        current_blob = self.container_client.get_blob_client(self._blob_name(kind, "CURRENT"))
+        if version_id is None:
+            from azure.core.exceptions import ResourceNotFoundError
+            try:
+                current_blob.delete_blob()
+            except ResourceNotFoundError:
+                pass
+        else:
+            current_blob.upload_blob(version_id.encode("utf-8"), overwrite=True)
+
+    def prune_versions(self, kind, keep=INDEX_KEEP_VERSIONS):
+        versions_prefix = self._blob_name(kind, VERSIONS_DIRNAME) + "/"
+        blobs_by_version = {}
+        for blob in self.container_client.list_blobs(name_starts_with=versions_prefix):
+            version_id = blob.name[len(versions_prefix):].split("/", 1)[0]
+            blobs_by_version.setdefault(version_id, []).append(blob.name)
+
+        current = self.get_current_version(kind)
+        previous = sorted(version_id for version_id in blobs_by_version if version_id != current)
+        for version_id in previous[:max(len(previous) - keep, 0)]:
+            for blob_name in blobs_by_version[version_id]:
+                self.container_client.get_blob_client(blob_name).delete_blob()
+
+
+def create_index_sync_store(container_client=None, backend=INDEX_SYNC_BACKEND):
+    """Returns the shared store for the configured backend, or None when indexes are not shared."""
+    if backend == "local":
+        return LocalIndexSyncStore(INDEX_SYNC_LOCAL_DIR)
+    if backend == "blob":
+        return BlobIndexSyncStore(container_client)
+    if backend != "none":
+        raise ValueError(f"Unknown INDEX_SYNC_BACKEND '{backend}', expected 'none', 'local' or 'blob'")
+    return None
+
+
+_store = None
+# kind -> {"root": local index root, "reload": loads the local CURRENT version, "served": version id in memory,
+#          "lock": held while this process builds or reloads it}
+_indexes = {}
+_lock = threading.Lock()
+_poller = None
+
+
+def register_synced_index(kind, root, reload_fn):
+    """Registers an index whose versions under root are shared; reload_fn serves the local CURRENT version."""
+    with _lock:
+        _indexes[kind] = {"root": root, "reload": reload_fn, "served": None, "lock": threading.Lock()}
+
+
+def _fetch_current_version(kind):
+    """Makes the shared CURRENT version of kind the local CURRENT one and returns it (None if there is none)."""
+    entry = _indexes[kind]
+    version_id = _store.get_current_version(kind)
+    if version_id is None:
+        return None
+    if not _is_version_complete(entry["root"], version_id):
+        print(f"Downloading '{kind}' index version {version_id}...")
+        _store.download_version(kind, version_id, entry["root"])
+    if get_current_version(entry["root"]) != version_id:
+        publish_version(entry["root"], version_id)
+    return version_id
+
+
+def _push_current_version(kind, version_id):
+    """Uploads version_id (None: the index is empty) and makes it the shared CURRENT version."""
+    entry = _indexes[kind]
+    if version_id is not None and not _store.has_version(kind, version_id):
+        _store.upload_version(kind, version_id, get_version_dir(entry["root"], version_id))
+    _store.set_current_version(kind, version_id)
+    _store.prune_versions(kind)
+    entry["served"] = version_id
+
+
+def load_synced_index(kind):
+    """
+    Loads kind for the first time: the shared CURRENT version, or the local one if nothing is shared yet.
+    Without a shared store this just serves the local CURRENT version.
+    """
+    entry = _indexes[kind]
+    with entry["lock"]:
+        version_id = _fetch_current_version(kind) if _store is not None else None
+        entry["reload"]()
+        entry["served"] = version_id
+
+
+def synced_build(kind, build_fn):
+    """
+    Runs build_fn, which builds and publishes a new local version of kind, as the only builder.
+    The build starts from the shared CURRENT version and its result becomes the shared CURRENT version.
+    Without a shared store this just calls build_fn.
+    """
+    if _store is None:
+        return build_fn()
+    with _indexes[kind]["lock"], _store.lock(kind):
+        # A local index seeds an empty shared store instead of being dropped
+        _fetch_current_version(kind)
+        built = build_fn()
+        _push_current_version(kind, get_current_version(_indexes[kind]["root"]) if built else None)
+    return built
+
+
+def synced_rollback(kind, rollback_fn):
+    """Runs rollback_fn (returns the version it published, or None) and shares its result."""
+    if _store is None:
+        return rollback_fn()
+    with _indexes[kind]["lock"], _store.lock(kind):
+        _fetch_current_version(kind)
+        version_id = rollback_fn()
+        if version_id is not None:
+            _push_current_version(kind, version_id)
+    return version_id
+
+
+def sync_index(kind):
+    """
+    Hot-reloads the shared CURRENT version of kind if it is not the one being served. Returns True if it did.
+    Skipped while this process is building kind; the build serves the newest version when it finishes.
+    """
+    entry = _indexes[kind]
+    if not entry["lock"].acquire(blocking=False):
+        return False
+    try:
+        shared_version = _store.get_current_version(kind)
+        if shared_version == entry["served"]:
+            return False
+
+        if shared_version is None:
+            unpublish_version(entry["root"])
+        else:
+            _fetch_current_version(kind)
+        entry["reload"]()
+        entry["served"] = shared_version
+    finally:
+        entry["lock"].release()
+    print(f"Reloaded '{kind}' index at shared version {shared_version}.")
+    return True
+
+
+def _poll_loop():
+    while True:
+        # The first check waits a full interval: startup loads the shared versions itself
+        time.sleep(INDEX_SYNC_POLL_SECONDS)
+        for kind in list(_indexes):
+            try:
+                sync_index(kind)
+            except Exception as e:
+                print(f"Index sync for '{kind}' failed: {e}")
+
+
+def start_index_sync(container_client=None):
+    """
+    Connects to the shared store configured by INDEX_SYNC_BACKEND and starts polling it for new versions.
+    Does nothing when the backend is "none".
+    """
+    global _store, _poller
+    with _lock:
+        if _poller is not None:
+            return
+        _store = create_index_sync_store(container_client)
+        if _store is None:
+            return
+        _poller = threading.Thread(target=_poll_loop, name="index-sync", daemon=True)
+        _poller.start()
+    print(f"Index sync started ({INDEX_SYNC_BACKEND} backend, every {INDEX_SYNC_POLL_SECONDS:g}s).")
+
+
+def get_index_sync_status():
+    return {
+        "backend": INDEX_SYNC_BACKEND if _store is not None else "none",
+        "poll_seconds": INDEX_SYNC_POLL_SECONDS,
+        "served_versions": {kind: entry["served"] for kind, entry in _indexes.items()}
+    }
@@ -0,0 +1,151 @@
+import os
+import time
+import uuid
+import shutil
+
+# Published versions kept on disk besides the current one, for rollback
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "3"))
+
+CURRENT_FILENAME = "CURRENT"
+VERSIONS_DIRNAME = "versions"
+# Written into a version directory when it is first published; directories without it are unfinished builds
+COMPLETE_FILENAME = ".complete"
+
+# An index root holds one directory per built version and a CURRENT file naming the published one:
+#
+#     <root>/CURRENT
+#     <root>/versions/<version_id>/...
+#
+# Builds persist into a fresh version directory and publish it by replacing CURRENT in one
+# os.replace, so readers see either the old or the new version and never a half-written one.
+
+
+def new_version_id():
+    """Sortable by creation time (microseconds), unique across processes."""
+    now = time.time()
+    return f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(now))}.{int(now % 1 * 1e6):06d}-{uuid.uuid4().hex[:8]}"
+
+
+def get_version_dir(root, version_id):
+    return os.path.join(root, VERSIONS_DIRNAME, version_id)
+
+
+def migrate_legacy_layout(root, extra_files=()):
+    """
+    Moves an index persisted straight into root (before versions existed), plus extra_files such
+    as a manifest kept outside it, into a version and publishes that version.
+    """
+    if not os.path.isdir(root) or os.path.exists(os.path.join(root, CURRENT_FILENAME)):
+        return
+    entries = [name for name in os.listdir(root) if name != VERSIONS_DIRNAME]
+    if not entries:
+        return
+
+    version_id = new_version_id()
+    version_dir = get_version_dir(root, version_id)
+    os.makedirs(version_dir)
+    for name in entries:
+        shutil.move(os.path.join(root, name), os.path.join(version_dir, name))
+    for path in extra_files:
+        if os.path.exists(path):
+            shutil.move(path, os.path.join(version_dir, os.path.basename(path)))
+    publish_version(root, version_id)
+    print(f"Moved the index in {root} to version {version_id}")
+
+
+def get_current_version(root):
+    """Returns the published version id, or None."""
+    try:
+        with open(os.path.join(root, CURRENT_FILENAME), "r", encoding="utf-8") as f:
+            version_id = f.read().strip()
+    except FileNotFoundError:
+        return None
+    if version_id and os.path.isdir(get_version_dir(root, version_id)):
+        return version_id
+    return None
+
+
+def get_current_version_dir(root):
+    version_id = get_current_version(root)
+    return get_version_dir(root, version_id) if version_id else None
+
+
+def create_version_dir(root):
+    """Returns (version_id, directory) for a new, unpublished version."""
+    version_id = new_version_id()
+    version_dir = get_version_dir(root, version_id)
+    os.makedirs(version_dir)
+    return version_id, version_dir
+
+
+def publish_version(root, version_id):
+    """Atomically points CURRENT at version_id, a fully persisted version."""
+    open(os.path.join(get_version_dir(root, version_id), COMPLETE_FILENAME), "w").close()
+    tmp_path = os.path.join(root, f"{CURRENT_FILENAME}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version_id)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILENAME))
+
+
+def unpublish_version(root):
+    """Leaves no version published (the index is empty); the versions stay available for rollback."""
+    try:
+        os.remove(os.path.join(root, CURRENT_FILENAME))
+    except FileNotFoundError:
+        pass
+
+
+def _version_dirs(root):
+    versions_dir = os.path.join(root, VERSIONS_DIRNAME)
+    if not os.path.isdir(versions_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(versions_dir)
+        # Dot-prefixed directories are versions still being copied in by index sync
+        if not name.startswith(".") and os.path.isdir(os.path.join(versions_dir, name))
+    )
+
+
+def list_versions(root):
+    """Ids of the versions that were published at some point, oldest first."""
+    return [
+        version_id for version_id in _version_dirs(root)
+        if os.path.exists(os.path.join(get_version_dir(root, version_id), COMPLETE_FILENAME))
+    ]
+
+
+def prune_versions(root, keep=INDEX_KEEP_VERSIONS, protect=()):
+    """
+    Deletes all but the newest keep versions besides the current one, and leftovers of builds that
+    never published. Versions in protect (e.g. one being built) are never deleted. Readers that still
+    hold an old index keep working: memory-mapped files stay readable after they are unlinked.
+    """
+    current = get_current_version(root)
+    complete = set(list_versions(root))
+    previous = [v for v in sorted(complete) if v != current and v not in protect]
+    unfinished = [v for v in _version_dirs(root) if v not in complete and v not in protect]
+    for version_id in previous[:max(len(previous) - keep, 0)] + unfinished:
+        shutil.rmtree(get_version_dir(root, version_id), ignore_errors=True)
+
+
+def get_rollback_target(root, version_id=None):
+    """The version a rollback would publish: version_id, or the newest one older than the current version."""
+    versions = list_versions(root)
+    if version_id is not None:
+        return version_id if version_id in versions else None
+    current = get_current_version(root)
+    older = [v for v in versions if current is None or v < current]
+    return older[-1] if older else None
+
+
+def describe_versions(root):
+    current = get_current_version(root)
+    return {
+        "current": current,
+        "versions": [
+            {"version_id": v, "current": v == current} for v in reversed(list_versions(root))
+        ],
+        "keep_versions": INDEX_KEEP_VERSIONS
+    }
@@ -0,0 +1,130 @@
+import os
+import time
+import threading
+from uuid import uuid4
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Finished jobs kept around for GET /jobs/{id}
+MAX_FINISHED_JOBS = int(os.getenv("INDEX_JOB_HISTORY", "200"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("INDEX_JOB_WORKERS", "2")),
+    thread_name_prefix="index-job"
+)
+_lock = threading.Lock()
+_jobs = OrderedDict()
+_builders = {}
+# Per index kind: whether a worker is draining the queue, the running job and the follow-up job
+_queues = {}
+
+
+def register_index_builder(kind, build_fn):
+    """
+    Registers the function that rebuilds the index of the given kind.
+    build_fn is called with a progress_callback keyword argument and returns True if an index was built.
+    """
+    with _lock:
+        _builders[kind] = build_fn
+        _queues.setdefault(kind, {"active": False, "running": None, "pending": None})
+
+
+def enqueue_index_job(kind, trigger):
+    """
+    Queues a rebuild of the given index and returns a snapshot of the job.
+
+    While a build is running, every further request is merged into a single follow-up job,
+    so a burst of uploads only costs one extra rebuild.
+    """
+    with _lock:
+        if kind not in _builders:
+            raise ValueError(f"No index builder registered for '{kind}'")
+
+        state = _queues[kind]
+        pending_id = state["pending"]
+        if pending_id is not None:
+            job = _jobs[pending_id]
+            job["triggers"].append(trigger)
+            return dict(job)
+
+        job = {
+            "job_id": str(uuid4()),
+            "kind": kind,
+            "status": "queued",
+            "triggers": [trigger],
+            "progress": {
+                "documents_loaded": 0,
+                "documents_embedded": 0,
+                "persisted": False
+            },
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None
+        }
+        _jobs[job["job_id"]] = job
+        state["pending"] = job["job_id"]
+        _prune_finished_jobs()
+
+        if not state["active"]:
+            state["active"] = True
+            _executor.submit(_drain_queue, kind)
+
+        return dict(job)
+
+
+def get_job(job_id):
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        snapshot = dict(job)
+        snapshot["progress"] = dict(job["progress"])
+        snapshot["triggers"] = list(job["triggers"])
+        return snapshot
+
+
+def _prune_finished_jobs():
+    finished = [job_id for job_id, job in _jobs.items() if job["finished_at"] is not None]
+    for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _jobs[job_id]
+
+
+def _make_progress_callback(job_id):
+    def progress_callback(**fields):
+        with _lock:
+            _jobs[job_id]["progress"].update(fields)
+    return progress_callback
+
+
+def _drain_queue(kind):
+    while True:
+        with _lock:
+            state = _queues[kind]
+            job_id = state["pending"]
+            if job_id is None:
+                state["active"] = False
+                return
+            state["pending"] = None
+            state["running"] = job_id
+            job = _jobs[job_id]
+            job["status"] = "running"
+            job["started_at"] = time.time()
+            build_fn = _builders[kind]
+
+        print(f"Index job {job_id} started for '{kind}' (triggers: {job['triggers']})")
+        try:
+            built = build_fn(progress_callback=_make_progress_callback(job_id))
+            status, result, error = "succeeded", ("indexed" if built else "empty"), None
+        except Exception as e:
+            print(f"Index job {job_id} for '{kind}' failed: {e}")
+            status, result, error = "failed", None, str(e)
+
+        with _lock:
+            job["status"] = status
+            job["result"] = result
+            job["error"] = error
+            job["finished_at"] = time.time()
+            state["running"] = None
+        print(f"Index job {job_id} for '{kind}' finished with status '{status}'.")
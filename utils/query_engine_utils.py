@@ -0,0 +1,136 @@
+import time
+import threading
+from collections import deque
+from contextvars import ContextVar
+from typing import List, Optional
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events.synthesis import SynthesizeStartEvent, SynthesizeEndEvent
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.utils import get_tokenizer
+
+
+def count_node_tokens(node):
+    """Tokens a retrieved node adds to the prompt: its text plus the metadata the LLM sees."""
+    return len(get_tokenizer()(node.get_content(metadata_mode=MetadataMode.LLM)))
+
+
+class TokenBudgetPostprocessor(BaseNodePostprocessor):
+    """
+    Keeps the best-ranked nodes whose prompt text fits in max_tokens and drops the rest, so the
+    context always fits one synthesis call. The first node is always kept.
+    """
+
+    max_tokens: int
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "TokenBudgetPostprocessor"
+
+    def _postprocess_nodes(
+        self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle] = None
+    ) -> List[NodeWithScore]:
+        kept = []
+        used = 0
+        for node in nodes:
+            tokens = count_node_tokens(node.node)
+            if kept and used + tokens > self.max_tokens:
+                break
+            kept.append(node)
+            used += tokens
+        return kept
+
+
+class StageTimings:
+    """Latency of the stages of recent queries (the last window of them), in milliseconds."""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.queries = 0
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, **stages_ms):
+        with self._lock:
+            self.queries += 1
+            for stage, value in stages_ms.items():
+                self._samples.setdefault(stage, deque(maxlen=self.window)).append(value)
+
+    def get_stats(self):
+        with self._lock:
+            stats = {"queries": self.queries}
+            for stage, samples in self._samples.items():
+                ordered = sorted(samples)
+                stats[stage] = {
+                    "mean": round(sum(ordered) / len(ordered), 2),
+                    "p50": round(ordered[len(ordered) // 2], 2),
+                    "p95": round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)], 2)
+                }
+            return stats
+
+
+# perf_counter() marks of the TimedQueryEngine query running in the current thread or task, None outside one
+_stage_marks = ContextVar("stage_marks", default=None)
+_stage_handler_lock = threading.Lock()
+_stage_handler_added = False
+
+
+class StageMarkEventHandler(BaseEventHandler):
+    """Notes when synthesis starts and ends, for the TimedQueryEngine query that triggered it."""
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "StageMarkEventHandler"
+
+    def handle(self, event, **kwargs):
+        marks = _stage_marks.get()
+        if marks is None:
+            return
+        if isinstance(event, SynthesizeStartEvent):
+            marks.setdefault("synthesize_start", time.perf_counter())
+        elif isinstance(event, SynthesizeEndEvent):
+            marks["synthesize_end"] = time.perf_counter()
+
+
+def _add_stage_handler():
+    global _stage_handler_added
+    with _stage_handler_lock:
+        if not _stage_handler_added:
+            get_dispatcher().add_event_handler(StageMarkEventHandler())
+            _stage_handler_added = True
+
+
+class TimedQueryEngine:
+    """
+    Runs queries through the query engine's own query(), so callbacks and instrumentation see them as usual,
+    and records how long retrieval (with postprocessors) and synthesis took and how much context reached the LLM.
+    The stage boundaries come from the synthesis instrumentation events.
+    """
+
+    def __init__(self, query_engine, timings):
+        self.query_engine = query_engine
+        self.timings = timings
+        _add_stage_handler()
+
+    def query(self, query_str):
+        marks = {}
+        token = _stage_marks.set(marks)
+        start = time.perf_counter()
+        try:
+            response = self.query_engine.query(query_str)
+        finally:
+            _stage_marks.reset(token)
+        finished = time.perf_counter()
+
+        synthesize_start = marks.get("synthesize_start", finished)
+        synthesize_end = marks.get("synthesize_end", finished)
+        nodes = response.source_nodes
+        self.timings.record(
+            retrieve_ms=(synthesize_start - start) * 1000,
+            synthesize_ms=(synthesize_end - synthesize_start) * 1000,
+            total_ms=(finished - start) * 1000,
+            nodes=len(nodes),
+            context_tokens=sum(count_node_tokens(node.node) for node in nodes)
+        )
+        return response
@@ -0,0 +1,69 @@
+import os
+import threading
+from llama_index.core import Settings
+from utils.embedding_cache_utils import (
+    EMBEDDING_CACHE_ENABLED, with_embedding_cache, get_embedding_store, get_query_embedding_cache
+)
+from utils.embedding_scheduler_utils import ScheduledEmbedding, with_embedding_scheduler
+
+safety_settings = [
+    {
+        "category": "HARM_CATEGORY_DANGEROUS",
+        "threshold": "BLOCK_LOW_AND_ABOVE",
+    },
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_LOW_AND_ABOVE",
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_LOW_AND_ABOVE",
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_LOW_AND_ABOVE",
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_LOW_AND_ABOVE",
+    },
+]
+
+_initialized = False
+_lock = threading.Lock()
+
+
+def init_rag_settings():
+    """
+    Points LlamaIndex's Settings at the Gemini embedding model and LLM both RAG tools use.
+    The Gemini clients are imported and created on the first call, not when the tools are imported.
+    """
+    global _initialized
+    if _initialized:
+        return
+    with _lock:
+        if _initialized:
+            return
+        from llama_index.llms.gemini import Gemini
+        from llama_index.embeddings.gemini import GeminiEmbedding
+
+        api_key = os.getenv("GOOGLE_API_KEY")
+        # Cached, so rebuilds only pay the embedding API for text it has never seen, and scheduled,
+        # so large builds embed in parallel batches within the rate limit and retry 429s
+        Settings.embed_model = with_embedding_scheduler(with_embedding_cache(GeminiEmbedding(
+            model_name=os.getenv('RAG_EMBEDDING_MODEL'), api_key=api_key
+        )))
+        Settings.llm = Gemini(model_name=os.getenv('RAG_LLM'), api_key=api_key, safety_settings=safety_settings, temperature=0)
+        _initialized = True
+
+
+def get_embedding_stats():
+    if not _initialized:
+        return {"initialized": False}
+    embed_model = Settings.embed_model
+    return {
+        "initialized": True,
+        "scheduler": embed_model.get_stats() if isinstance(embed_model, ScheduledEmbedding) else None,
+        "cache": get_embedding_store().get_stats() if EMBEDDING_CACHE_ENABLED else None,
+        "query_cache": get_query_embedding_cache().get_stats() if EMBEDDING_CACHE_ENABLED else None
+    }
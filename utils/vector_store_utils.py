@@ -0,0 +1,353 @@
+import os
+import json
+import threading
+from typing import Any, List, Optional, Sequence
+import numpy as np
+from pydantic import PrivateAttr
+from llama_index.core import StorageContext
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+from utils.ann_utils import HnswIndex
+
+# Marks a vector store file written by MmapVectorStore rather than SimpleVectorStore
+MMAP_FORMAT = "mmap_f32"
+DEFAULT_VECTOR_STORE_FILENAME = "default__vector_store.json"
+# Rows copied at a time when persisting, so a memory-mapped matrix is never read whole
+PERSIST_BLOCK_ROWS = 65536
+
+
+def _matrix_path(persist_path):
+    return os.path.splitext(persist_path)[0] + ".f32"
+
+
+def _ann_path(persist_path):
+    return os.path.splitext(persist_path)[0] + ".hnsw"
+
+
+def _unit_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    Vector store that keeps unit-length float32 embeddings in one contiguous matrix.
+
+    Persisting writes the matrix as raw float32 next to a small JSON file of node ids, and
+    loading maps it with np.memmap, so startup does not parse embeddings and queries are a
+    single matrix-vector product (cosine similarity, same scores as SimpleVectorStore).
+    Rows added after loading live in memory until the next persist; deleted rows are masked.
+    With ann_backend="hnsw" the persisted rows are searched through an HNSW graph instead.
+    A SimpleVectorStore JSON file found at the load path is converted on the fly.
+    """
+
+    stores_text: bool = False
+    # "hnsw" builds an approximate nearest-neighbour graph over the persisted rows, "none" scores every row
+    ann_backend: str = "none"
+    ann_m: int = 16
+    ann_ef_construction: int = 200
+    ann_ef_search: int = 128
+
+    _lock: Any = PrivateAttr()
+    _dim: Optional[int] = PrivateAttr()
+    # Rows loaded from disk (np.memmap) and rows added since, in that order
+    _base: Optional[np.ndarray] = PrivateAttr()
+    _added: List[np.ndarray] = PrivateAttr()
+    _added_matrix: Optional[np.ndarray] = PrivateAttr()
+    _ids: List[str] = PrivateAttr()
+    _ref_doc_ids: List[str] = PrivateAttr()
+    _id_to_row: dict = PrivateAttr()
+    _ref_doc_rows: dict = PrivateAttr()
+    _alive: np.ndarray = PrivateAttr()
+    _ann: Optional[HnswIndex] = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._dim = None
+        self._base = None
+        self._added = []
+        self._added_matrix = None
+        self._ids = []
+        self._ref_doc_ids = []
+        self._id_to_row = {}
+        self._ref_doc_rows = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._ann = None
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    def count(self):
+        """Number of live rows. Not __len__: StorageContext tests the store for truthiness."""
+        return len(self._id_to_row)
+
+    def _append_rows(self, ids, ref_doc_ids):
+        start = len(self._ids)
+        for offset, (node_id, ref_doc_id) in enumerate(zip(ids, ref_doc_ids)):
+            previous_row = self._id_to_row.get(node_id)
+            if previous_row is not None:
+                self._delete_row(previous_row)
+            row = start + offset
+            self._ids.append(node_id)
+            self._ref_doc_ids.append(ref_doc_id)
+            self._id_to_row[node_id] = row
+            self._ref_doc_rows.setdefault(ref_doc_id, []).append(row)
+        self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+
+    def _delete_row(self, row):
+        if not self._alive[row]:
+            return
+        self._alive[row] = False
+        del self._id_to_row[self._ids[row]]
+        rows = self._ref_doc_rows.get(self._ref_doc_ids[row])
+        if rows is not None:
+            rows.remove(row)
+            if not rows:
+                del self._ref_doc_rows[self._ref_doc_ids[row]]
+
+    def _matrices(self):
+        """The row blocks in row order: the loaded matrix and, stacked once, everything added since."""
+        if self._added:
+            stacked = [self._added_matrix] if self._added_matrix is not None else []
+            self._added_matrix = np.vstack(stacked + self._added)
+            self._added = []
+        return [m for m in (self._base, self._added_matrix) if m is not None]
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        vectors = _unit_rows([node.get_embedding() for node in nodes])
+        with self._lock:
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the store ({self._dim})")
+            self._added.append(vectors)
+            self._append_rows(
+                [node.node_id for node in nodes],
+                [node.ref_doc_id or "None" for node in nodes]
+            )
+        return [node.node_id for node in nodes]
+
+    def get(self, text_id: str) -> List[float]:
+        """Returns the stored (unit-length) embedding of a node."""
+        with self._lock:
+            row = self._id_to_row[text_id]
+            offset = 0
+            for matrix in self._matrices():
+                if row < offset + len(matrix):
+                    return matrix[row - offset].tolist()
+                offset += len(matrix)
+        raise KeyError(text_id)
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        with self._lock:
+            for row in list(self._ref_doc_rows.get(ref_doc_id, [])):
+                self._delete_row(row)
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters=None, **delete_kwargs: Any) -> None:
+        if filters is not None:
+            raise ValueError("MmapVectorStore does not support metadata filters.")
+        with self._lock:
+            for node_id in node_ids or []:
+                row = self._id_to_row.get(node_id)
+                if row is not None:
+                    self._delete_row(row)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def _select(self, rows, scores, top_k):
+        if len(rows) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+            rows, scores = rows[best], scores[best]
+        order = np.argsort(-scores)
+        return VectorStoreQueryResult(
+            similarities=[float(score) for score in scores[order]],
+            ids=[self._ids[row] for row in rows[order]]
+        )
+
+    def _ann_query(self, query_vector, top_k):
+        """Graph search over the persisted rows, exact scoring of the rows added since."""
+        base_rows = len(self._base)
+        deleted = base_rows - int(self._alive[:base_rows].sum())
+        rows, scores = self._ann.search(query_vector, top_k + deleted)
+        keep = self._alive[rows]
+        rows, scores = rows[keep], scores[keep]
+
+        matrices = self._matrices()
+        if len(matrices) > 1:
+            added_rows = np.arange(base_rows, base_rows + len(matrices[1]))
+            added_scores = matrices[1] @ query_vector
+            keep = self._alive[added_rows]
+            rows = np.concatenate([rows, added_rows[keep]])
+            scores = np.concatenate([scores, added_scores[keep]])
+        return self._select(rows, scores, top_k)
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise ValueError("MmapVectorStore does not support metadata filters.")
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"Invalid query mode: {query.mode}")
+
+        query_vector = _unit_rows([query.query_embedding])[0]
+        with self._lock:
+            top_k = min(query.similarity_top_k, len(self._id_to_row))
+            if top_k <= 0:
+                return VectorStoreQueryResult(similarities=[], ids=[])
+            if self._ann is not None and query.node_ids is None:
+                return self._ann_query(query_vector, top_k)
+
+            scores = np.concatenate([matrix @ query_vector for matrix in self._matrices()])
+            candidates = self._alive.copy()
+            if query.node_ids is not None:
+                allowed = np.zeros(len(candidates), dtype=bool)
+                allowed[[self._id_to_row[i] for i in query.node_ids if i in self._id_to_row]] = True
+                candidates &= allowed
+            rows = np.flatnonzero(candidates)
+            if not len(rows):
+                return VectorStoreQueryResult(similarities=[], ids=[])
+            return self._select(rows, scores[rows], min(top_k, len(rows)))
+
+    def persist(self, persist_path: str = DEFAULT_VECTOR_STORE_FILENAME, fs=None) -> None:
+        """
+        Writes the live rows as raw float32 next to persist_path, which gets the node ids, builds the
+        ANN index over them if one is configured, and switches the store over to the written files.
+        """
+        dirpath = os.path.dirname(persist_path)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+        matrix_path = _matrix_path(persist_path)
+        ann_path = _ann_path(persist_path)
+
+        with self._lock:
+            ids = []
+            ref_doc_ids = []
+            with open(matrix_path + ".tmp", "wb") as f:
+                offset = 0
+                for matrix in self._matrices():
+                    for start in range(0, len(matrix), PERSIST_BLOCK_ROWS):
+                        end = min(start + PERSIST_BLOCK_ROWS, len(matrix))
+                        alive = self._alive[offset + start:offset + end]
+                        f.write(np.ascontiguousarray(matrix[start:end][alive], dtype=np.float32).tobytes())
+                        rows = np.flatnonzero(alive) + offset + start
+                        ids.extend(self._ids[row] for row in rows)
+                        ref_doc_ids.extend(self._ref_doc_ids[row] for row in rows)
+                    offset += len(matrix)
+
+            with open(persist_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({
+                    "format": MMAP_FORMAT,
+                    "dim": self._dim,
+                    "ids": ids,
+                    "ref_doc_ids": ref_doc_ids
+                }, f)
+
+            ann = None
+            if self.ann_backend == "hnsw" and ids:
+                ann = self._build_ann(
+                    np.memmap(matrix_path + ".tmp", dtype=np.float32, mode="r", shape=(len(ids), self._dim))
+                )
+
+            # Matrix first: ids that point past the end of an old matrix would be worse than the reverse
+            os.replace(matrix_path + ".tmp", matrix_path)
+            if ann is not None:
+                ann.save(ann_path)
+            elif os.path.exists(ann_path):
+                os.remove(ann_path)
+            os.replace(persist_path + ".tmp", persist_path)
+
+            self._load(persist_path)
+
+    def _build_ann(self, vectors):
+        try:
+            return HnswIndex.build(vectors, self.ann_m, self.ann_ef_construction, self.ann_ef_search)
+        except ImportError:
+            print("hnswlib is not installed, falling back to exact vector search.")
+            return None
+
+    def _load(self, persist_path):
+        with open(persist_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        self._reset()
+        if data.get("format") == MMAP_FORMAT:
+            if data["ids"]:
+                self._dim = data["dim"]
+                self._base = np.memmap(
+                    _matrix_path(persist_path), dtype=np.float32, mode="r", shape=(len(data["ids"]), data["dim"])
+                )
+                self._append_rows(data["ids"], data["ref_doc_ids"])
+        else:
+            # SimpleVectorStore JSON: convert it, the next persist writes the mmap format
+            embedding_dict = data.get("embedding_dict", {})
+            if embedding_dict:
+                text_ids = list(embedding_dict)
+                ref_doc_ids = data.get("text_id_to_ref_doc_id", {})
+                self._base = _unit_rows([embedding_dict[text_id] for text_id in text_ids])
+                self._dim = self._base.shape[1]
+                self._append_rows(text_ids, [ref_doc_ids.get(text_id, "None") for text_id in text_ids])
+
+        if self.ann_backend == "hnsw" and self._base is not None:
+            self._ann = self._load_ann(_ann_path(persist_path))
+
+    def _load_ann(self, ann_path):
+        if os.path.exists(ann_path):
+            try:
+                ann = HnswIndex.load(ann_path, self._dim, self.ann_ef_search)
+                if len(ann) == len(self._base):
+                    return ann
+                print(f"ANN index {ann_path} does not match the vector store, rebuilding it in memory.")
+            except ImportError:
+                print("hnswlib is not installed, falling back to exact vector search.")
+                return None
+            except Exception as e:
+                print(f"Failed to load ANN index {ann_path}, rebuilding it in memory: {e}")
+        return self._build_ann(self._base)
+
+    @classmethod
+    def from_persist_path(cls, persist_path: str, fs=None, **kwargs: Any) -> "MmapVectorStore":
+        if not os.path.exists(persist_path):
+            raise ValueError(f"No existing vector store found at {persist_path}, skipping load.")
+        store = cls(**kwargs)
+        store._load(persist_path)
+        return store
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str, **kwargs: Any) -> "MmapVectorStore":
+        return cls.from_persist_path(os.path.join(persist_dir, DEFAULT_VECTOR_STORE_FILENAME), **kwargs)
+
+
+def create_storage_context(backend, persist_dir=None, **store_kwargs):
+    """
+    Storage context for an index using the given vector store backend: "mmap" (MmapVectorStore,
+    configured with store_kwargs such as the ANN settings) or "simple" (LlamaIndex's JSON
+    SimpleVectorStore). Pass persist_dir to load a persisted index.
+    """
+    if backend == "simple":
+        return StorageContext.from_defaults(persist_dir=persist_dir)
+    if backend != "mmap":
+        raise ValueError(f"Unknown vector store backend: {backend}")
+
+    if persist_dir:
+        vector_store = MmapVectorStore.from_persist_dir(persist_dir, **store_kwargs)
+    else:
+        vector_store = MmapVectorStore(**store_kwargs)
+    return StorageContext.from_defaults(persist_dir=persist_dir, vector_store=vector_store)
@@ -0,0 +1,141 @@
+"""
+Minimal local stand-in for the Zoho accounts and Desk APIs the ticket tools use, for running them
+without a Zoho account:
+
+    python -m utils.zoho_mock_server --port 8765
+    ZOHO_DESK_BASE_URL=http://127.0.0.1:8765 ZOHO_ACCOUNTS_BASE_URL=http://127.0.0.1:8765 ...
+
+It counts the TCP connections it accepted, so connection reuse can be checked from the outside.
+"""
+import json
+import uuid
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+class ZohoMockState:
+    def __init__(self, token_expires_in=3600):
+        self.token_expires_in = token_expires_in
+        self.valid_tokens = set()
+        self.tickets = {}
+        self.connections = 0
+        self.requests = 0
+        self.token_requests = 0
+        self.lock = threading.Lock()
+
+    def issue_token(self):
+        token = uuid.uuid4().hex
+        with self.lock:
+            self.valid_tokens.add(token)
+            self.token_requests += 1
+        return token
+
+    def expire_tokens(self):
+        """Makes every issued token invalid, as if they had all expired."""
+        with self.lock:
+            self.valid_tokens.clear()
+
+
+class ZohoMockHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep the connection open
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.state.lock:
+            self.server.state.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _authorized(self):
+        token = self.headers.get("Authorization", "").removeprefix("Zoho-oauthtoken ")
+        with self.server.state.lock:
+            valid = token in self.server.state.valid_tokens
+        if not valid:
+            self._send_json(401, {"errorCode": "INVALID_OAUTH", "message": "The OAuth Token you provided is invalid."})
+        return valid
+
+    def do_POST(self):
+        state = self.server.state
+        path = urlparse(self.path).path
+        with state.lock:
+            state.requests += 1
+
+        if path == "/oauth/v2/token":
+            self._read_json()
+            self._send_json(200, {
+                "access_token": state.issue_token(),
+                "expires_in": state.token_expires_in,
+                "token_type": "Bearer"
+            })
+        elif path == "/api/v1/tickets":
+            payload = self._read_json()
+            if not self._authorized():
+                return
+            ticket = {"id": str(len(state.tickets) + 1), "statusType": "Open", **payload}
+            with state.lock:
+                state.tickets[ticket["id"]] = ticket
+            self._send_json(200, ticket)
+        else:
+            self._send_json(404, {"errorCode": "URL_NOT_FOUND"})
+
+    def do_GET(self):
+        state = self.server.state
+        path = urlparse(self.path).path
+        with state.lock:
+            state.requests += 1
+
+        if path.startswith("/api/v1/tickets/"):
+            if not self._authorized():
+                return
+            ticket = state.tickets.get(path.rsplit("/", 1)[-1])
+            if ticket is None:
+                self._send_json(404, {"errorCode": "RESOURCE_NOT_FOUND"})
+            else:
+                self._send_json(200, ticket)
+        else:
+            self._send_json(404, {"errorCode": "URL_NOT_FOUND"})
+
+
+def start_zoho_mock_server(port=0, token_expires_in=3600):
+    """Starts the mock server on a background thread; returns (server, base url). Stop it with server.shutdown()."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), ZohoMockHandler)
+    server.daemon_threads = True
+    server.state = ZohoMockState(token_expires_in)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--token-expires-in", type=int, default=3600)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), ZohoMockHandler)
+    server.daemon_threads = True
+    server.state = ZohoMockState(args.token_expires_in)
+    print(f"Zoho mock server on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,289 @@
 import os
-from dotenv import load_dotenv
+import time
+import asyncio
+import threading
 import requests
+from collections import deque
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+
+
+class ZohoConfig:
+    """Zoho settings, read from the environment (and .env) once per process."""
+
+    def __init__(self):
+        load_dotenv()
+        # Point both at utils/zoho_mock_server.py to run without a Zoho account
+        self.desk_base_url = os.getenv("ZOHO_DESK_BASE_URL", "https://desk.zoho.in").rstrip("/")
+        self.accounts_base_url = os.getenv("ZOHO_ACCOUNTS_BASE_URL", "https://accounts.zoho.in").rstrip("/")
+        self.refresh_token = os.getenv("ZOHO_REFRESH_TOKEN")
+        self.client_id = os.getenv("ZOHO_CLIENT_ID")
+        self.client_secret = os.getenv("ZOHO_CLIENT_SECRET")
+        self.org_id = os.getenv("ZOHO_ORG_ID")
+        self.department_id = os.getenv("ZOHO_DEPARTMENT_ID")
+        self.contact_id = os.getenv("ZOHO_CONTACT_ID")
+        self.connect_timeout = float(os.getenv("ZOHO_CONNECT_TIMEOUT_SECONDS", "5"))
+        self.read_timeout = float(os.getenv("ZOHO_READ_TIMEOUT_SECONDS", "20"))
+        # Retries of connection errors, and of 429/5xx answers to GETs; a ticket is never created twice
+        self.max_retries = int(os.getenv("ZOHO_MAX_RETRIES", "3"))
+        # Keep-alive connections kept per host
+        self.pool_size = int(os.getenv("ZOHO_POOL_SIZE", "10"))
+        # Access tokens are renewed this long before they expire (Zoho issues them for an hour)
+        self.token_refresh_margin = float(os.getenv("ZOHO_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+        # Wait before the background refresher tries again after a failed refresh
+        self.token_retry_seconds = float(os.getenv("ZOHO_TOKEN_RETRY_SECONDS", "30"))
+
 
-# Global cache for access token
+_config = None
+_session = None
+_async_client = None
+_client_lock = threading.Lock()
+
+# Global cache for access token; expires_at is a time.time() timestamp
 _access_token_cache = {
-    "token": None
+    "token": None,
+    "expires_in": 0.0,
+    "expires_at": 0.0
 }
+# Held by the one thread fetching a new token; the others wait for it and reuse its token
+_token_refresh_lock = threading.Lock()
+_token_refresher_started = False
+_token_stats = {"refreshes": 0, "failures": 0, "background_refreshes": 0, "waited_for_refresh": 0, "invalid_token_retries": 0}
+_token_refresh_ms = deque(maxlen=100)
+_token_stats_lock = threading.Lock()
 
-def get_zoho_access_token(force_refresh=False):
-    global _access_token_cache
 
-    if _access_token_cache["token"] and not force_refresh:
-        return _access_token_cache["token"]
+def get_zoho_config():
+    global _config
+    with _client_lock:
+        if _config is None:
+            _config = ZohoConfig()
+        return _config
+
+
+def get_zoho_session():
+    """requests.Session shared by every Zoho call, so connections (and TLS sessions) are reused."""
+    global _session
+    config = get_zoho_config()
+    with _client_lock:
+        if _session is None:
+            retry = Retry(
+                total=config.max_retries,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset({"GET"}),
+                respect_retry_after_header=True,
+                raise_on_status=False
+            )
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=config.pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
 
-    load_dotenv()
+def get_zoho_async_client():
+    """httpx.AsyncClient counterpart of get_zoho_session, for calls made from the event loop."""
+    global _async_client
+    config = get_zoho_config()
+    with _client_lock:
+        if _async_client is None:
+            import httpx
 
-    refresh_token = os.getenv("ZOHO_REFRESH_TOKEN")
-    client_id = os.getenv("ZOHO_CLIENT_ID")
-    client_secret = os.getenv("ZOHO_CLIENT_SECRET")
+            _async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(config.read_timeout, connect=config.connect_timeout),
+                limits=httpx.Limits(max_keepalive_connections=config.pool_size, max_connections=config.pool_size * 2),
+                # httpx retries connection failures only
+                transport=httpx.AsyncHTTPTransport(retries=config.max_retries)
+            )
+        return _async_client
 
-    if not all([refresh_token, client_id, client_secret]):
+
+def _timeout():
+    config = get_zoho_config()
+    return (config.connect_timeout, config.read_timeout)
+
+
+def _count_token_stat(**fields):
+    with _token_stats_lock:
+        for key, value in fields.items():
+            _token_stats[key] += value
+
+
+def _refresh_margin():
+    # Never more than half the token lifetime, so short-lived tokens are not refreshed back to back
+    return min(get_zoho_config().token_refresh_margin, _access_token_cache["expires_in"] / 2)
+
+
+def _token_is_fresh():
+    return _access_token_cache["token"] is not None and time.time() < _access_token_cache["expires_at"] - _refresh_margin()
+
+
+def _refresh_access_token():
+    """Fetches a new access token from Zoho and caches it with its expiry. Call with _token_refresh_lock held."""
+    config = get_zoho_config()
+    if not all([config.refresh_token, config.client_id, config.client_secret]):
         raise ValueError("Missing one or more environment variables")
 
-    token_url = "https://accounts.zoho.in/oauth/v2/token"
+    token_url = f"{config.accounts_base_url}/oauth/v2/token"
     params = {
-        "refresh_token": refresh_token,
-        "client_id": client_id,
-        "client_secret": client_secret,
+        "refresh_token": config.refresh_token,
+        "client_id": config.client_id,
+        "client_secret": config.client_secret,
         "grant_type": "refresh_token"
     }
 
+    start = time.perf_counter()
     try:
-        response = requests.post(token_url, params=params)
+        response = get_zoho_session().post(token_url, params=params, timeout=_timeout())
         response.raise_for_status()
-        access_token = response.json().get("access_token")
+        body = response.json()
+        access_token = body.get("access_token")
 
         if not access_token:
             raise Exception("Access token not found in response")
 
-        _access_token_cache["token"] = access_token
-        return access_token
+    except Exception as e:
+        _count_token_stat(failures=1)
+        if isinstance(e, requests.RequestException):
+            raise Exception(f"Error fetching access token: {e}")
+        raise
+
+    with _token_stats_lock:
+        _token_stats["refreshes"] += 1
+        _token_refresh_ms.append((time.perf_counter() - start) * 1000)
+    expires_in = float(body.get("expires_in") or 3600)
+    _access_token_cache["token"] = access_token
+    _access_token_cache["expires_in"] = expires_in
+    _access_token_cache["expires_at"] = time.time() + expires_in
+    return access_token
+
+
+def get_zoho_access_token(force_refresh=False, rejected_token=None):
+    """
+    Returns a cached access token, fetching a new one when there is none, it is about to expire
+    (ZOHO_TOKEN_REFRESH_MARGIN_SECONDS) or force_refresh is set. Concurrent callers share a single refresh:
+    with force_refresh, pass the token Zoho rejected, so a token another thread already replaced it with is reused.
+    """
+    if not force_refresh and _token_is_fresh():
+        return _access_token_cache["token"]
+
+    if _token_refresh_lock.locked():
+        _count_token_stat(waited_for_refresh=1)
+    with _token_refresh_lock:
+        # Another thread may have refreshed while this one waited for the lock
+        if force_refresh:
+            if rejected_token is not None and _access_token_cache["token"] not in (None, rejected_token):
+                return _access_token_cache["token"]
+        elif _token_is_fresh():
+            return _access_token_cache["token"]
+        return _refresh_access_token()
+
+
+def _token_refresh_loop():
+    config = get_zoho_config()
+    while True:
+        if _access_token_cache["token"] is None:
+            delay = 0
+        else:
+            delay = _access_token_cache["expires_at"] - _refresh_margin() - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            with _token_refresh_lock:
+                if not _token_is_fresh():
+                    _refresh_access_token()
+                    _count_token_stat(background_refreshes=1)
+        except Exception as e:
+            print(f"Background Zoho token refresh failed: {e}")
+            time.sleep(config.token_retry_seconds)
+
+
+def start_zoho_token_refresher():
+    """
+    Starts a daemon thread that renews the access token ZOHO_TOKEN_REFRESH_MARGIN_SECONDS before it expires,
+    so requests never wait for a refresh or hit an expired token. Does nothing when Zoho is not configured.
+    """
+    global _token_refresher_started
+    config = get_zoho_config()
+    if not all([config.refresh_token, config.client_id, config.client_secret]):
+        print("Zoho credentials not set; background token refresh disabled")
+        return
+    with _client_lock:
+        if _token_refresher_started:
+            return
+        _token_refresher_started = True
+    threading.Thread(target=_token_refresh_loop, name="zoho-token-refresh", daemon=True).start()
+
+
+def get_zoho_token_stats():
+    with _token_stats_lock:
+        samples = sorted(_token_refresh_ms)
+        stats = {
+            "background_refresher": _token_refresher_started,
+            "refresh_margin_seconds": get_zoho_config().token_refresh_margin,
+            "token_lifetime_seconds": _access_token_cache["expires_in"] or None,
+            "expires_in_seconds": (
+                round(_access_token_cache["expires_at"] - time.time(), 1) if _access_token_cache["token"] else None
+            ),
+            **_token_stats
+        }
+        if samples:
+            stats["refresh_ms"] = {
+                "last": round(_token_refresh_ms[-1], 2),
+                "mean": round(sum(samples) / len(samples), 2),
+                "p95": round(samples[min(int(len(samples) * 0.95), len(samples) - 1)], 2),
+                "max": round(samples[-1], 2)
+            }
+        return stats
+
+
+def _desk_headers(token):
+    return {
+        "Authorization": f"Zoho-oauthtoken {token}",
+        "orgId": get_zoho_config().org_id,
+        "Content-Type": "application/json"
+    }
+
+
+def _is_invalid_token(status_code, text):
+    return status_code == 401 and "INVALID_OAUTH" in text
+
+
+def zoho_desk_request(method, path, **kwargs):
+    """
+    Calls the Zoho Desk API (path like "/api/v1/tickets") on the pooled session.
+    If the access token is rejected it is refreshed and the call is retried once.
+    """
+    url = f"{get_zoho_config().desk_base_url}{path}"
+    session = get_zoho_session()
+
+    # First attempt
+    token = get_zoho_access_token()
+    response = session.request(method, url, headers=_desk_headers(token), timeout=_timeout(), **kwargs)
+
+    # If unauthorized, refresh token and retry once
+    if _is_invalid_token(response.status_code, response.text):
+        print("Token Invalid... Creating New!!")
+        _count_token_stat(invalid_token_retries=1)
+        token = get_zoho_access_token(force_refresh=True, rejected_token=token)
+        response = session.request(method, url, headers=_desk_headers(token), timeout=_timeout(), **kwargs)
+    return response
+
+
+async def azoho_desk_request(method, path, **kwargs):
+    """Async zoho_desk_request on the shared httpx.AsyncClient. Token refreshes run on a worker thread."""
+    url = f"{get_zoho_config().desk_base_url}{path}"
+    client = get_zoho_async_client()
 
-    except requests.RequestException as e:
-        raise Exception(f"Error fetching access token: {e}")
+    token = await asyncio.to_thread(get_zoho_access_token)
+    response = await client.request(method, url, headers=_desk_headers(token), **kwargs)
 
+    if _is_invalid_token(response.status_code, response.text):
+        print("Token Invalid... Creating New!!")
+        _count_token_stat(invalid_token_retries=1)
+        token = await asyncio.to_thread(get_zoho_access_token, True, token)
+        response = await client.request(method, url, headers=_desk_headers(token), **kwargs)
+    return response